@@ -11,7 +11,7 @@ async def create_user(user_data: UserSignUp):
     - Creates a new user in the Firebase Realtime Database
     - Hashes the password for secure storage
     """
-    return AuthService.signup(user_data)
+    return await AuthService.signup(user_data)
 
 @router.post("/signin", response_model=User)
 async def login_user(user_data: UserSignIn):
@@ -21,4 +21,4 @@ async def login_user(user_data: UserSignIn):
     - Returns the username
     - Returns the user's product_id
     """
-    return AuthService.signin(user_data)
\ No newline at end of file
+    return await AuthService.signin(user_data)
\ No newline at end of file
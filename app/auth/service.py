@@ -1,19 +1,19 @@
-from app.db.firebase import user_exists, create_user_in_db, get_user, get_product_id
-from app.core.security import hash_password, verify_password
+from app.db.firebase import user_exists, create_user_in_db, get_user
+from app.core.security import hash_password_async, verify_password_async
 from app.core.exceptions import AuthError, BadRequestError
 from app.auth.models import UserSignUp, UserSignIn
 
 
 class AuthService:
     @staticmethod
-    def signup(user_data: UserSignUp) -> dict:
+    async def signup(user_data: UserSignUp) -> dict:
         """Register a new user in the Firebase Realtime Database."""
         # Check if user already exists
-        if user_exists(user_data.username):
+        if await user_exists(user_data.username):
             raise BadRequestError(f"Username {user_data.username} already exists")
 
-        # Hash the password
-        hashed_password = hash_password(user_data.password)
+        # Hash the password (on the password pool, off the event loop)
+        hashed_password = await hash_password_async(user_data.password)
 
         # Create user node in Firebase
         user_data_dict = {
@@ -23,7 +23,7 @@ class AuthService:
         }
 
         # Add to database
-        create_user_in_db(user_data.username, user_data_dict)
+        await create_user_in_db(user_data.username, user_data_dict)
 
         # Return success without sensitive information
         return {
@@ -32,16 +32,16 @@ class AuthService:
         }
 
     @staticmethod
-    def signin(user_data: UserSignIn) -> dict:
+    async def signin(user_data: UserSignIn) -> dict:
         """Authenticate a user and return a JWT token."""
         # Get user from database
-        user = get_user(user_data.username)
+        user = await get_user(user_data.username)
 
         if not user:
             raise AuthError("Invalid username or password")
 
-        # Verify password
-        if not verify_password(user_data.password, user['password']):
+        # Verify password (on the password pool, off the event loop)
+        if not await verify_password_async(user_data.password, user['password']):
             raise AuthError("Invalid username or password")
 
         # Generate access token
@@ -51,5 +51,5 @@ class AuthService:
             #"access_token": access_token,
             #"token_type": "bearer",
             "username": user_data.username,
-            "product_id": get_product_id(user_data.username)
+            "product_id": user.get("product_id")
         }
\ No newline at end of file
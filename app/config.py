@@ -4,19 +4,105 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-# Firebase configuration
-FIREBASE_URL = os.getenv("FIREBASE_URL")
-if not FIREBASE_URL:
-    raise ValueError("FIREBASE_URL environment variable is not set. This is required for Firebase operations.")
+# Storage backend: "firebase" (default), "memory" or "sqlite"
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "firebase").lower()
+SQLITE_DATABASE_PATH = os.getenv("SQLITE_DATABASE_PATH", "1meter.sqlite3")  # Database file for the sqlite backend
 
+# Firebase configuration (only needed by the firebase backend)
+FIREBASE_URL = os.getenv("FIREBASE_URL")
 FIREBASE_API_KEY = os.getenv("FIREBASE_API_KEY")
-if not FIREBASE_API_KEY:
-    raise ValueError("FIREBASE_API_KEY environment variable is not set. This is required for Firebase operations.")
+
+# Path to your Firebase service account file
+FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH", "path/to/serviceAccountKey.json")
 
 # JWT settings
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
-if not JWT_SECRET_KEY:
-    raise ValueError("JWT_SECRET_KEY environment variable is not set. This is required for secure token generation.")
-
 JWT_ALGORITHM = "HS256"
-JWT_EXPIRATION_MINUTES = 60 * 24  # 24 hours
\ No newline at end of file
+JWT_EXPIRATION_MINUTES = 60 * 24  # 24 hours
+
+# Database client settings
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "16"))  # Worker threads for blocking Firebase calls
+
+# Result cache settings
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # Memory cap for cached results
+RESULT_CACHE_OPEN_PERIOD_TTL_SECONDS = int(os.getenv("RESULT_CACHE_OPEN_PERIOD_TTL_SECONDS", "60"))  # TTL for periods still in progress
+ROLLUP_GRACE_SECONDS = int(os.getenv("ROLLUP_GRACE_SECONDS", "86400"))  # How long after a period ends late readings are still expected
+
+# HTTP caching of chart responses
+CHART_CACHE_MAX_AGE_SECONDS = int(os.getenv("CHART_CACHE_MAX_AGE_SECONDS", "86400"))  # Cache-Control max-age for charts of elapsed periods
+
+# Fleet connection status settings
+FLEET_STATUS_CONCURRENCY = int(os.getenv("FLEET_STATUS_CONCURRENCY", "20"))  # Max per-device status reads in flight while loading presence
+FLEET_STATUS_TIMEOUT_SECONDS = float(os.getenv("FLEET_STATUS_TIMEOUT_SECONDS", "5"))  # Timeout for each of those reads
+FLEET_STATUS_MAX_PAGE_SIZE = int(os.getenv("FLEET_STATUS_MAX_PAGE_SIZE", "1000"))  # Largest page of the fleet status endpoint
+
+# Batch billing settings
+BILLING_CONCURRENCY = int(os.getenv("BILLING_CONCURRENCY", "8"))  # Products whose kWh is computed at the same time
+
+# Admin endpoint settings
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # Required in the X-Admin-Token header of admin endpoints; they are disabled while unset
+
+# Connection status write buffer settings
+CONNECTION_STATUS_FLUSH_SECONDS = float(os.getenv("CONNECTION_STATUS_FLUSH_SECONDS", "2"))  # Longest a status update waits to be written; 0 writes immediately
+CONNECTION_STATUS_MAX_PENDING = int(os.getenv("CONNECTION_STATUS_MAX_PENDING", "1000"))  # Products waiting before the buffer is flushed early
+
+# Device presence settings
+PRESENCE_TTL_SECONDS = int(os.getenv("PRESENCE_TTL_SECONDS", "300"))  # A device not heard from for this long is offline
+PRESENCE_SWEEP_SECONDS = float(os.getenv("PRESENCE_SWEEP_SECONDS", "30"))  # How often devices that went quiet are marked offline
+PRESENCE_USERS_REFRESH_SECONDS = float(os.getenv("PRESENCE_USERS_REFRESH_SECONDS", "300"))  # How often the user directory is re-read
+PRESENCE_USERS_PAGE_SIZE = int(os.getenv("PRESENCE_USERS_PAGE_SIZE", "500"))  # Users read per range query when loading the directory
+
+# Reading ingestion settings
+INGEST_MAX_READINGS = int(os.getenv("INGEST_MAX_READINGS", "10000"))  # Max readings accepted in one request
+INGEST_MAX_PATHS_PER_WRITE = int(os.getenv("INGEST_MAX_PATHS_PER_WRITE", "5000"))  # Max paths in one multi-path update
+
+# Raw reading export settings
+EXPORT_CHUNK_DAYS = int(os.getenv("EXPORT_CHUNK_DAYS", "7"))  # Days fetched per range query while streaming an export
+EXPORT_MAX_DAYS = int(os.getenv("EXPORT_MAX_DAYS", "366"))  # Longest date range one export may cover
+
+# Batch chart settings
+BATCH_CHART_MAX_QUERIES = int(os.getenv("BATCH_CHART_MAX_QUERIES", "100"))  # Max chart queries in one batch request
+
+# Time range chart settings
+RANGE_MAX_POINTS = int(os.getenv("RANGE_MAX_POINTS", "5000"))  # Largest point budget a range chart may ask for
+RANGE_MAX_DAYS = int(os.getenv("RANGE_MAX_DAYS", "3660"))  # Longest range one chart may cover
+RANGE_MAX_RAW_DAYS = int(os.getenv("RANGE_MAX_RAW_DAYS", "7"))  # Longest range read as raw minutes; longer ones use hourly rollups
+
+# Live usage stream settings
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "100"))  # Readings buffered per client before the oldest are dropped
+LIVE_IDLE_SECONDS = float(os.getenv("LIVE_IDLE_SECONDS", "30"))  # Keep a product's listener this long after its last client leaves
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))  # Keepalive interval of quiet streams
+
+# Metrics settings
+DB_BYTES_SAMPLE_RATE = float(os.getenv("DB_BYTES_SAMPLE_RATE", "0.01"))  # Share of requests whose database reads are sized for the byte metrics
+
+# Request profiling settings
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")  # Allow profiling requests on demand
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")  # If set, the X-Profile header must carry this value
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")  # Where request profiles are stored
+
+# Password hashing settings
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))  # Threads running bcrypt
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))  # Queued + running hashes before rejecting with 503
+
+# Startup settings
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() in ("1", "true", "yes")  # Open the database connection and worker pools at boot
+
+
+# Required settings are checked when they are first needed rather than at import,
+# so modules can be imported (by tooling, benchmarks or jobs) without credentials.
+
+def validate_firebase_config():
+    """Raise if the settings the firebase backend needs are missing."""
+    if not FIREBASE_URL:
+        raise ValueError("FIREBASE_URL environment variable is not set. This is required for Firebase operations.")
+    if not FIREBASE_API_KEY:
+        raise ValueError("FIREBASE_API_KEY environment variable is not set. This is required for Firebase operations.")
+
+
+def validate_config():
+    """Raise if a setting the API server needs is missing. Called at startup."""
+    if DATABASE_BACKEND == "firebase":
+        validate_firebase_config()
+    if not JWT_SECRET_KEY:
+        raise ValueError("JWT_SECRET_KEY environment variable is not set. This is required for secure token generation.")
@@ -0,0 +1,45 @@
+import hashlib
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from app.config import CHART_CACHE_MAX_AGE_SECONDS
+
+
+# Settled periods (ended more than ROLLUP_GRACE_SECONDS ago) can still change if a
+# very late reading is uploaded, so they are cached for CHART_CACHE_MAX_AGE_SECONDS
+# rather than forever. Periods in progress or within the grace window (and empty
+# results, which may come from a failed read) are stored but revalidated every time.
+OPEN_CACHE_CONTROL = "no-cache"
+
+
+def _etag(body: bytes) -> str:
+    """A strong ETag for a response body: equal bodies get equal tags."""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses the weak comparison, so W/ prefixes are ignored."""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+def conditional_response(request: Request, result: BaseModel, closed: bool) -> Response:
+    """
+    Render a result as JSON with an ETag and Cache-Control, or as a bodiless 304 when
+    the client already holds the same body (its If-None-Match matches).
+
+    closed says whether the result covers a settled period.
+    """
+    body = result.model_dump_json().encode()
+    etag = _etag(body)
+    cache_control = f"public, max-age={CHART_CACHE_MAX_AGE_SECONDS}" if closed else OPEN_CACHE_CONTROL
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
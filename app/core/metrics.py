@@ -0,0 +1,303 @@
+import bisect
+import contextvars
+import random
+import re
+import threading
+import time
+from typing import Dict, Sequence, Tuple
+
+from app.config import DB_BYTES_SAMPLE_RATE
+from app.core.cache import result_cache
+
+
+# Minimal Prometheus instrumentation: counters and histograms with labels, rendered in
+# the text exposition format served at /metrics.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CALL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """A monotonically increasing value per label set."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return "\n".join(lines)
+
+
+class Gauge:
+    """A value that can go up and down."""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def render(self) -> str:
+        return f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} gauge\n{self.name} {self._value}"
+
+
+class Histogram:
+    """Observations counted into cumulative buckets per label set, with their sum and count."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], list] = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, counts in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {counts[-1]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return "\n".join(lines)
+
+
+# HTTP requests, labelled by route template (e.g. /electricity/hourly/{product_id}/{date})
+http_requests = Counter(
+    "http_requests_total", "HTTP requests handled", ("method", "route", "status")
+)
+http_request_errors = Counter(
+    "http_request_errors_total", "HTTP requests that failed with a server error", ("method", "route")
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route")
+)
+http_request_db_calls = Histogram(
+    "http_request_db_calls", "Database calls made while serving one HTTP request", ("method", "route"),
+    buckets=CALL_COUNT_BUCKETS
+)
+http_request_db_bytes = Histogram(
+    "http_request_db_downloaded_bytes",
+    "Bytes downloaded from the database while serving one HTTP request (sampled requests only)",
+    ("method", "route"), buckets=BYTES_BUCKETS
+)
+
+# Database calls, labelled by operation (get, get_range, set, update)
+db_calls = Counter("db_calls_total", "Database calls", ("operation",))
+db_errors = Counter("db_errors_total", "Database calls that raised", ("operation",))
+db_call_duration = Histogram("db_call_duration_seconds", "Database call latency", ("operation",))
+db_downloaded_bytes = Histogram(
+    "db_downloaded_bytes", "JSON size of the data returned by one database call (sampled requests only)",
+    ("operation",),
+    buckets=BYTES_BUCKETS
+)
+
+# Password hashing pool (bcrypt for signup/signin)
+password_hash_pending = Gauge("password_hash_pending", "Password hashes queued or running")
+password_hash_rejected = Counter("password_hash_rejected_total", "Password hashes refused because the queue was full")
+password_hash_wait = Histogram("password_hash_queue_seconds", "Time password hashes waited for a worker")
+password_hash_duration = Histogram("password_hash_duration_seconds", "Time spent hashing or verifying a password")
+
+# Connection status write buffer
+connection_status_updates = Counter("connection_status_updates_total", "Connection status updates received")
+connection_status_flushes = Counter("connection_status_writes_total", "Database writes storing connection status updates")
+connection_status_writes_saved = Counter(
+    "connection_status_writes_saved_total", "Connection status updates coalesced into another write"
+)
+connection_status_dropped = Counter(
+    "connection_status_dropped_total", "Connection status updates that couldn't be written before shutdown"
+)
+
+# Live usage streams
+live_subscribers = Gauge("live_subscribers", "Clients streaming live usage")
+live_listeners = Gauge("live_listeners", "Upstream database listeners feeding live usage streams")
+live_dropped_readings = Counter("live_dropped_readings_total", "Readings dropped because a live client fell behind")
+
+_METRICS = (
+    http_requests, http_request_errors, http_request_duration, http_request_db_calls, http_request_db_bytes,
+    db_calls, db_errors, db_call_duration, db_downloaded_bytes,
+    password_hash_pending, password_hash_rejected, password_hash_wait, password_hash_duration,
+    connection_status_updates, connection_status_flushes, connection_status_writes_saved,
+    connection_status_dropped,
+    live_subscribers, live_listeners, live_dropped_readings,
+)
+
+
+class RequestStats:
+    """
+    Database usage accumulated by one request, shared by every task it spawns. Sizing a
+    read means serializing it, so only a DB_BYTES_SAMPLE_RATE share of requests is sized.
+    """
+
+    __slots__ = ("db_calls", "db_bytes", "sized")
+
+    def __init__(self, sized: bool = False):
+        self.db_calls = 0
+        self.db_bytes = 0
+        self.sized = sized
+
+
+_request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+def db_reads_sized() -> bool:
+    """Whether the request being served, if any, was sampled to have its database reads sized."""
+    stats = _request_stats.get()
+    return stats is not None and stats.sized
+
+
+def record_db_call(operation: str, seconds: float, downloaded_bytes: int = 0, failed: bool = False):
+    """Record one database call, and charge it to the request being served, if any."""
+    db_calls.inc(operation=operation)
+    db_call_duration.observe(seconds, operation=operation)
+    if failed:
+        db_errors.inc(operation=operation)
+    if downloaded_bytes:
+        db_downloaded_bytes.observe(downloaded_bytes, operation=operation)
+
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_calls += 1
+        stats.db_bytes += downloaded_bytes
+
+
+def _cache_metrics() -> str:
+    stats = result_cache.stats()
+    return "\n".join([
+        "# HELP result_cache_entries Entries in the result cache",
+        "# TYPE result_cache_entries gauge",
+        f"result_cache_entries {stats['entries']}",
+        "# HELP result_cache_bytes Estimated size of the result cache",
+        "# TYPE result_cache_bytes gauge",
+        f"result_cache_bytes {stats['bytes']}",
+        "# HELP result_cache_max_bytes Memory cap of the result cache",
+        "# TYPE result_cache_max_bytes gauge",
+        f"result_cache_max_bytes {stats['max_bytes']}",
+        "# HELP result_cache_hits_total Result cache hits",
+        "# TYPE result_cache_hits_total counter",
+        f"result_cache_hits_total {stats['hits']}",
+        "# HELP result_cache_misses_total Result cache misses",
+        "# TYPE result_cache_misses_total counter",
+        f"result_cache_misses_total {stats['misses']}",
+        "# HELP result_cache_evictions_total Result cache evictions",
+        "# TYPE result_cache_evictions_total counter",
+        f"result_cache_evictions_total {stats['evictions']}",
+    ])
+
+
+def render_metrics() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    return "\n".join([metric.render() for metric in _METRICS] + [_cache_metrics()]) + "\n"
+
+
+def route_template(scope) -> str:
+    """
+    The path template of the route that handled a request, e.g.
+    /electricity/hourly/{product_id}/{date}, or "unmatched".
+    """
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path is None:
+        return "unmatched"
+
+    # Recent FastAPI versions keep included routers nested, so the route's own path
+    # lacks the router prefix; recover it from the part of the URL before the match
+    match = re.search(route.path_regex.pattern.lstrip("^"), scope["path"])
+    if match and match.start():
+        return scope["path"][:match.start()] + path
+    return path
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, status, errors and database usage of every HTTP
+    request under its route template. Streaming responses are measured until their last
+    chunk has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(sized=random.random() < DB_BYTES_SAMPLE_RATE)
+        token = _request_stats.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_stats.reset(token)
+            # Label by route template so product IDs and dates don't end up in label values
+            route_label = route_template(scope)
+            method = scope["method"]
+
+            http_requests.inc(method=method, route=route_label, status=status_code)
+            http_request_duration.observe(time.perf_counter() - start, method=method, route=route_label)
+            http_request_db_calls.observe(stats.db_calls, method=method, route=route_label)
+            if stats.sized:
+                http_request_db_bytes.observe(stats.db_bytes, method=method, route=route_label)
+            if status_code >= 500:
+                http_request_errors.inc(method=method, route=route_label)
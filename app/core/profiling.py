@@ -0,0 +1,175 @@
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import List, Optional
+from urllib.parse import parse_qs
+
+from fastapi.logger import logger
+
+from app.config import PROFILING_TOKEN, PROFILE_DIR
+from app.core.metrics import route_template
+
+
+# On-demand profiling of single requests. When PROFILING_ENABLED is set, a request
+# carrying an "X-Profile" header (or a "profile" query parameter) is run under cProfile
+# while every database call it makes is recorded on a timeline. The result is stored as
+#   {PROFILE_DIR}/{profile_id}.json  summary, database timeline and hottest functions
+#   {PROFILE_DIR}/{profile_id}.prof  the full cProfile stats (for pstats or snakeviz)
+# and the profile id is returned in the X-Profile-Id response header.
+
+# Functions listed in the JSON summary, by cumulative time
+TOP_FUNCTIONS = 40
+
+
+class ProfileSession:
+    """Database calls made by the request being profiled."""
+
+    __slots__ = ("started", "db_calls")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_calls: List[dict] = []
+
+
+_session = contextvars.ContextVar("profile_session", default=None)
+
+# cProfile can only profile one request at a time
+_profiling_lock = threading.Lock()
+
+
+def is_profiling() -> bool:
+    """Whether the request being served, if any, is being profiled."""
+    return _session.get() is not None
+
+
+def record_db_timeline(operation: str, path: str, started: float, seconds: float,
+                       downloaded_bytes: int = 0, failed: bool = False):
+    """Add a database call to the timeline of the request being profiled, if any."""
+    session: Optional[ProfileSession] = _session.get()
+    if session is None:
+        return
+
+    session.db_calls.append({
+        "operation": operation,
+        "path": path,
+        "start_ms": round((started - session.started) * 1000, 3),
+        "duration_ms": round(seconds * 1000, 3),
+        "bytes": downloaded_bytes,
+        "failed": failed,
+    })
+
+
+def _busy_ms(db_calls: List[dict]) -> float:
+    """Wall-clock time during which at least one database call was in flight."""
+    busy = 0.0
+    covered_until = 0.0
+    for call in sorted(db_calls, key=lambda call: call["start_ms"]):
+        end = call["start_ms"] + call["duration_ms"]
+        if end > covered_until:
+            busy += end - max(call["start_ms"], covered_until)
+            covered_until = end
+    return round(busy, 3)
+
+
+def _profile_requested(scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == b"x-profile":
+            return PROFILING_TOKEN is None or value.decode("latin-1") == PROFILING_TOKEN
+
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if "profile" in query:
+        return PROFILING_TOKEN is None or query["profile"][-1] == PROFILING_TOKEN
+    return False
+
+
+def _top_functions(profiler: cProfile.Profile) -> List[dict]:
+    stats = pstats.Stats(profiler)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+    return [
+        {
+            "function": f"{filename}:{line}({name})",
+            "calls": calls,
+            "own_ms": round(own_time * 1000, 3),
+            "cumulative_ms": round(cumulative_time * 1000, 3),
+        }
+        for (filename, line, name), (_, calls, own_time, cumulative_time, _) in rows
+    ]
+
+
+def _store_profile(profile_id: str, summary: dict, profiler: cProfile.Profile):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{profile_id}.prof"))
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w") as file:
+        json.dump(summary, file, indent=2)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling requests that ask for it. Only added to the app when
+    PROFILING_ENABLED is set, so it costs nothing otherwise.
+
+    cProfile follows the event loop thread, so other requests interleaved with the
+    profiled one on the loop show up in its CPU profile; database calls run on worker
+    threads and appear on the timeline instead.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _profile_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        if not _profiling_lock.acquire(blocking=False):
+            logger.warning(f"Not profiling {scope['path']}: another request is being profiled")
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        session = ProfileSession()
+        token = _session.set(session)
+        status_code = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - session.started
+            _session.reset(token)
+            _profiling_lock.release()
+
+            summary = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "route": route_template(scope),
+                "status": status_code,
+                "duration_ms": round(duration * 1000, 3),
+                # Concurrent calls overlap, so their summed time can exceed the time spent waiting on them
+                "db_call_time_ms": round(sum(call["duration_ms"] for call in session.db_calls), 3),
+                "db_busy_ms": _busy_ms(session.db_calls),
+                "db_calls": session.db_calls,
+                "top_functions": _top_functions(profiler),
+            }
+            try:
+                _store_profile(profile_id, summary, profiler)
+                logger.info(f"Stored profile {profile_id} for {scope['method']} {scope['path']}")
+            except OSError as e:
+                logger.error(f"Error storing profile {profile_id}: {str(e)}")
@@ -1,7 +1,22 @@
+import asyncio
+import hmac
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 import bcrypt
 from datetime import datetime, timedelta
+from fastapi import Header
 from jose import jwt
-from app.config import JWT_SECRET_KEY, JWT_ALGORITHM, JWT_EXPIRATION_MINUTES
+from app.config import (
+    JWT_SECRET_KEY, JWT_ALGORITHM, JWT_EXPIRATION_MINUTES, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING,
+    ADMIN_TOKEN
+)
+from app.core.exceptions import AuthError, ForbiddenError, ServiceUnavailableError
+from app.core.metrics import password_hash_pending, password_hash_rejected, password_hash_wait, password_hash_duration
+
+# Dedicated pool for bcrypt, which takes 100-300 ms of CPU per call (and releases the GIL while it runs)
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
 
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt."""
@@ -16,6 +31,46 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         hashed_password.encode('utf-8')
     )
 
+async def _run_password_work(func, *args):
+    """
+    Run a bcrypt call on the password pool without blocking the event loop.
+
+    Once PASSWORD_HASH_MAX_PENDING calls are queued or running, further calls are
+    refused with a 503 instead of piling up behind them.
+    """
+    if password_hash_pending.value >= PASSWORD_HASH_MAX_PENDING:
+        password_hash_rejected.inc()
+        raise ServiceUnavailableError("Too many sign-in requests in progress, please retry shortly")
+
+    queued_at = time.perf_counter()
+
+    def timed():
+        started = time.perf_counter()
+        password_hash_wait.observe(started - queued_at)
+        try:
+            return func(*args)
+        finally:
+            password_hash_duration.observe(time.perf_counter() - started)
+
+    password_hash_pending.inc()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_password_executor, timed)
+    finally:
+        password_hash_pending.dec()
+
+async def warm_up_password_pool():
+    """Start the password pool's threads ahead of the first signins."""
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(_password_executor, time.sleep, 0.01) for _ in range(PASSWORD_HASH_WORKERS)))
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password on the password pool."""
+    return await _run_password_work(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash on the password pool."""
+    return await _run_password_work(verify_password, plain_password, hashed_password)
+
 def create_access_token(data: dict) -> str:
     """Create a JWT token with an expiration time."""
     to_encode = data.copy()
@@ -25,4 +80,11 @@ def create_access_token(data: dict) -> str:
 
 def verify_token(token: str) -> dict:
     """Verify and decode a JWT token."""
-    return jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
\ No newline at end of file
+    return jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Route dependency of admin endpoints: the X-Admin-Token header must match ADMIN_TOKEN."""
+    if not ADMIN_TOKEN:
+        raise ForbiddenError("Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise AuthError("Invalid admin token")
\ No newline at end of file
@@ -0,0 +1,424 @@
+import json
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import FIREBASE_URL, FIREBASE_CREDENTIALS_PATH, SQLITE_DATABASE_PATH, validate_firebase_config
+
+
+# Storage backends behind DatabaseReference. Every backend stores the same JSON tree
+# as the Firebase Realtime Database, addressed by slash-separated paths ("" is the
+# root), and follows its write semantics: setting None or an empty dict deletes a
+# node, and parents left without children disappear with it.
+#
+# Backends are synchronous; DatabaseReference runs them on its worker pool.
+#
+# The memory and sqlite backends order keys as plain strings in range queries,
+# which matches Firebase for the date/hour/minute keys used by this service. Like
+# Firebase, they return nodes keyed by mostly-dense integers ("0", "1", ...) as arrays.
+#
+# listen() follows Firebase's change events: the callback gets ("put", path, data)
+# first for the current value of the listened node ("/") and then for every write
+# under it, with the path relative to the listened node.
+
+# Callback of listen(): (event type, path relative to the listened node, data)
+ListenCallback = Callable[[str, str, Any], None]
+
+
+def _split(path: str) -> List[str]:
+    return [part for part in path.split("/") if part]
+
+
+def _join(*parts: str) -> str:
+    return "/".join(part.strip("/") for part in parts if part and part.strip("/"))
+
+
+def _normalize(value: Any) -> Any:
+    """Copy a value the way Firebase would store it: lists become dicts and empty nodes vanish."""
+    if isinstance(value, list):
+        value = {str(index): item for index, item in enumerate(value)}
+    if isinstance(value, dict):
+        children = {str(key): _normalize(item) for key, item in value.items()}
+        children = {key: item for key, item in children.items() if item is not None}
+        return children or None
+    return value
+
+
+def _as_read(value: Any) -> Any:
+    """
+    Render a stored value the way Firebase returns it: a node whose keys are all
+    integers, with more than half of the slots from 0 to the largest one filled,
+    comes back as an array with None in the gaps.
+    """
+    if not isinstance(value, dict):
+        return value
+
+    value = {key: _as_read(item) for key, item in value.items()}
+    if all(key.isdigit() and (key == "0" or key[0] != "0") for key in value):
+        length = max(int(key) for key in value) + 1
+        if len(value) * 2 > length:
+            array = [None] * length
+            for key, item in value.items():
+                array[int(key)] = item
+            return array
+    return value
+
+
+def _select_keys(keys: List[str], start, end, limit_to_first, limit_to_last) -> List[str]:
+    keys = [key for key in sorted(keys) if (start is None or key >= start) and (end is None or key <= end)]
+    if limit_to_first is not None:
+        keys = keys[:limit_to_first]
+    if limit_to_last is not None:
+        keys = keys[-limit_to_last:] if limit_to_last else []
+    return keys
+
+
+class StorageBackend:
+    """Operations a storage backend provides to DatabaseReference."""
+
+    def get(self, path: str) -> Any:
+        """Return the value at a path, or None if there is none."""
+        raise NotImplementedError
+
+    def get_range(self, path: str, start: Optional[str] = None, end: Optional[str] = None,
+                  limit_to_first: Optional[int] = None, limit_to_last: Optional[int] = None) -> Optional[dict]:
+        """Return the children of a path whose keys fall between start and end (inclusive)."""
+        raise NotImplementedError
+
+    def set(self, path: str, value: Any):
+        """Replace the value at a path."""
+        raise NotImplementedError
+
+    def update(self, path: str, values: Dict[str, Any]):
+        """Set several paths relative to a path at once."""
+        raise NotImplementedError
+
+    def listen(self, path: str, callback: ListenCallback):
+        """
+        Call callback with the value at a path and then with every change under it,
+        from a background thread. Returns a registration whose close() stops it.
+        """
+        raise NotImplementedError
+
+
+class FirebaseBackend(StorageBackend):
+    """Firebase Realtime Database through the firebase_admin SDK."""
+
+    def __init__(self, database_url: str, credentials_path: str):
+        import firebase_admin
+        from firebase_admin import credentials, db
+
+        self._db = db
+        self.app = firebase_admin.initialize_app(credentials.Certificate(credentials_path), {
+            'databaseURL': database_url
+        })
+
+    def _ref(self, path: str):
+        return self._db.reference(path or "/")
+
+    def get(self, path):
+        return self._ref(path).get()
+
+    def get_range(self, path, start=None, end=None, limit_to_first=None, limit_to_last=None):
+        query = self._ref(path).order_by_key()
+        if start is not None:
+            query = query.start_at(start)
+        if end is not None:
+            query = query.end_at(end)
+        if limit_to_first is not None:
+            query = query.limit_to_first(limit_to_first)
+        if limit_to_last is not None:
+            query = query.limit_to_last(limit_to_last)
+        return query.get()
+
+    def set(self, path, value):
+        self._ref(path).set(value)
+
+    def update(self, path, values):
+        self._ref(path).update(values)
+
+    def listen(self, path, callback):
+        return self._ref(path).listen(lambda event: callback(event.event_type, event.path, event.data))
+
+
+class _Registration:
+    """A local backend listener; close() unregisters it."""
+
+    def __init__(self, listeners: Dict[int, Tuple[List[str], ListenCallback]], key: int):
+        self._listeners = listeners
+        self._key = key
+
+    def close(self):
+        self._listeners.pop(self._key, None)
+
+
+class _ChangeFeed:
+    """listen() for the local backends: writes are reported to listeners once they are stored."""
+
+    def _init_change_feed(self):
+        self._listeners: Dict[int, Tuple[List[str], ListenCallback]] = {}
+        self._next_listener = 0
+
+    def listen(self, path, callback):
+        with self._lock:
+            key = self._next_listener
+            self._next_listener += 1
+            self._listeners[key] = (_split(path), callback)
+        callback("put", "/", self.get(path))
+        return _Registration(self._listeners, key)
+
+    def _notify(self, writes: List[Tuple[List[str], Any]]):
+        """
+        Send ("put", path, data) for each (parts, normalized value) write to the listeners
+        it touches. Callbacks run on the writing thread and must not call the backend.
+        """
+        for listened, callback in list(self._listeners.values()):
+            for parts, value in writes:
+                if parts[:len(listened)] == listened:
+                    callback("put", "/" + "/".join(parts[len(listened):]), _as_read(value))
+                elif listened[:len(parts)] == parts:
+                    # The write replaced an ancestor of the listened node
+                    for part in listened[len(parts):]:
+                        value = value.get(part) if isinstance(value, dict) else None
+                    callback("put", "/", _as_read(value))
+
+
+class MemoryBackend(_ChangeFeed, StorageBackend):
+    """The whole tree in nested dicts. Values are copied in and out, so callers can't alias stored data."""
+
+    def __init__(self, data: Optional[dict] = None):
+        self._root = _normalize(data) or {}
+        self._lock = threading.Lock()
+        self._init_change_feed()
+
+    def _node(self, parts: List[str]):
+        node = self._root
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def get(self, path):
+        with self._lock:
+            node = self._node(_split(path))
+            return _as_read(node) if node != {} else None
+
+    def get_range(self, path, start=None, end=None, limit_to_first=None, limit_to_last=None):
+        with self._lock:
+            node = self._node(_split(path))
+            if not isinstance(node, dict):
+                return None
+            keys = _select_keys(list(node), start, end, limit_to_first, limit_to_last)
+            return {key: _as_read(node[key]) for key in keys} or None
+
+    def set(self, path, value):
+        writes = [(_split(path), _normalize(value))]
+        with self._lock:
+            self._set(*writes[0])
+            # Reported under the lock: the stored nodes are the written values and later writes modify them
+            if self._listeners:
+                self._notify(writes)
+
+    def update(self, path, values):
+        parts = _split(path)
+        writes = [(parts + _split(key), _normalize(value)) for key, value in values.items()]
+        with self._lock:
+            for write in writes:
+                self._set(*write)
+            if self._listeners:
+                self._notify(writes)
+
+    def _set(self, parts: List[str], value):
+        if not parts:
+            self._root = value if isinstance(value, dict) else {}
+            return
+
+        if value is None:
+            # Delete the node, then any parents it leaves empty
+            ancestors = []
+            node = self._root
+            for part in parts[:-1]:
+                if not isinstance(node, dict) or part not in node:
+                    return
+                ancestors.append((node, part))
+                node = node[part]
+            if isinstance(node, dict):
+                node.pop(parts[-1], None)
+            while ancestors and not node:
+                parent, key = ancestors.pop()
+                del parent[key]
+                node = parent
+            return
+
+        node = self._root
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        node[parts[-1]] = value
+
+
+class SQLiteBackend(_ChangeFeed, StorageBackend):
+    """
+    The tree in a SQLite file, one row per node keyed by (parent path, key).
+
+    Leaves hold their JSON-encoded value and inner nodes hold NULL, so a node's children
+    and the subtree under a path are both index range scans.
+    """
+
+    def __init__(self, database_path: str):
+        self._conn = sqlite3.connect(database_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS nodes ("
+                " parent TEXT NOT NULL, key TEXT NOT NULL, value TEXT,"
+                " PRIMARY KEY (parent, key)) WITHOUT ROWID"
+            )
+        self._init_change_feed()
+
+    def _subtree(self, path: str) -> Optional[dict]:
+        """Rebuild the dict under an inner node from its descendants' rows."""
+        if path:
+            # Descendants' parents are the path itself or start with "path/" ("0" sorts right after "/")
+            rows = self._conn.execute(
+                "SELECT parent, key, value FROM nodes WHERE parent = ? OR (parent >= ? AND parent < ?)",
+                (path, path + "/", path + "0")
+            )
+        else:
+            rows = self._conn.execute("SELECT parent, key, value FROM nodes")
+
+        prefix_length = len(_split(path))
+        tree = {}
+        for parent, key, value in rows:
+            node = tree
+            for part in _split(parent)[prefix_length:]:
+                node = node.setdefault(part, {})
+            if value is None:
+                node.setdefault(key, {})
+            else:
+                node[key] = json.loads(value)
+        return tree or None
+
+    def _get(self, path: str):
+        parts = _split(path)
+        if not parts:
+            return self._subtree("")
+
+        row = self._conn.execute(
+            "SELECT value FROM nodes WHERE parent = ? AND key = ?", ("/".join(parts[:-1]), parts[-1])
+        ).fetchone()
+        if row is None:
+            return None
+        if row[0] is not None:
+            return json.loads(row[0])
+        return self._subtree("/".join(parts))
+
+    def get(self, path):
+        with self._lock:
+            return _as_read(self._get(path))
+
+    def get_range(self, path, start=None, end=None, limit_to_first=None, limit_to_last=None):
+        path = _join(path)
+        query = "SELECT key, value FROM nodes WHERE parent = ?"
+        params = [path]
+        if start is not None:
+            query += " AND key >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND key <= ?"
+            params.append(end)
+        if limit_to_last is not None:
+            query += " ORDER BY key DESC LIMIT ?"
+            params.append(limit_to_last)
+        elif limit_to_first is not None:
+            query += " ORDER BY key LIMIT ?"
+            params.append(limit_to_first)
+
+        with self._lock:
+            children = self._conn.execute(query, params).fetchall()
+            result = {
+                key: json.loads(value) if value is not None else _as_read(self._subtree(_join(path, key)))
+                for key, value in sorted(children)
+            }
+        return result or None
+
+    def set(self, path, value):
+        self._write([(_split(path), _normalize(value))])
+
+    def update(self, path, values):
+        parts = _split(path)
+        self._write([(parts + _split(key), _normalize(value)) for key, value in values.items()])
+
+    def _write(self, writes: List[Tuple[List[str], Any]]):
+        """Store (parts, normalized value) writes in one transaction."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for parts, value in writes:
+                    self._set(parts, value)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if self._listeners:
+            self._notify(writes)
+
+    def _set(self, parts: List[str], value):
+        path = "/".join(parts)
+        if parts:
+            self._conn.execute(
+                "DELETE FROM nodes WHERE (parent = ? AND key = ?) OR parent = ? OR (parent >= ? AND parent < ?)",
+                ("/".join(parts[:-1]), parts[-1], path, path + "/", path + "0")
+            )
+        else:
+            self._conn.execute("DELETE FROM nodes")
+
+        if value is None:
+            # Remove the parents this left empty
+            for depth in range(len(parts) - 1, 0, -1):
+                ancestor = "/".join(parts[:depth])
+                if self._conn.execute("SELECT 1 FROM nodes WHERE parent = ? LIMIT 1", (ancestor,)).fetchone():
+                    break
+                self._conn.execute(
+                    "DELETE FROM nodes WHERE parent = ? AND key = ?", ("/".join(parts[:depth - 1]), parts[depth - 1])
+                )
+            return
+
+        if not parts and not isinstance(value, dict):
+            return
+
+        # Make every ancestor an inner node (replacing a leaf that was in the way)
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO nodes (parent, key, value) VALUES (?, ?, NULL)",
+            [("/".join(parts[:depth]), parts[depth]) for depth in range(len(parts) - 1)]
+        )
+        self._conn.executemany("INSERT INTO nodes (parent, key, value) VALUES (?, ?, ?)", self._rows(parts, value))
+
+    @staticmethod
+    def _rows(parts: List[str], value):
+        """Flatten a normalized value stored at a path into node rows."""
+        if parts:
+            parent, key = "/".join(parts[:-1]), parts[-1]
+            if not isinstance(value, dict):
+                yield parent, key, json.dumps(value)
+                return
+            yield parent, key, None
+
+        for child_key, child in value.items():
+            yield from SQLiteBackend._rows(parts + [child_key], child)
+
+
+def create_backend(name: str) -> StorageBackend:
+    """Build the storage backend selected by DATABASE_BACKEND."""
+    if name == "firebase":
+        validate_firebase_config()
+        return FirebaseBackend(FIREBASE_URL, FIREBASE_CREDENTIALS_PATH)
+    if name == "memory":
+        return MemoryBackend()
+    if name == "sqlite":
+        return SQLiteBackend(SQLITE_DATABASE_PATH)
+    raise ValueError(f"Unknown DATABASE_BACKEND '{name}'. Use firebase, memory or sqlite.")
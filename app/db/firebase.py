@@ -1,55 +1,265 @@
-import os
-import firebase_admin
-from firebase_admin import credentials, db
-from app.config import FIREBASE_URL
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
 
-# Path to your Firebase service account file
-FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH", "path/to/serviceAccountKey.json")
+from app.config import DATABASE_BACKEND, DATABASE_POOL_SIZE
+from app.core.metrics import db_reads_sized, record_db_call
+from app.core.profiling import is_profiling, record_db_timeline
+from app.db.backends import create_backend
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
-firebase_app = firebase_admin.initialize_app(cred, {
-    'databaseURL': FIREBASE_URL
-})
+# Bounded pool that runs the blocking backend calls off the event loop
+_executor = ThreadPoolExecutor(max_workers=DATABASE_POOL_SIZE, thread_name_prefix="firebase-db")
 
+# Storage backend selected by DATABASE_BACKEND, created on first use so importing
+# this module doesn't need credentials or initialize firebase_admin
+_backend = None
+_backend_lock = threading.Lock()
 
-# Helper class to wrap Firebase Realtime Database operations with chaining
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(DATABASE_BACKEND)
+    return _backend
+
+
+def set_backend(backend):
+    """Replace the storage backend (used by benchmarks to wrap or swap it)."""
+    global _backend
+    _backend = backend
+
+
+async def _run_blocking(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args))
+
+
+def _call_backend(operation: str, *args):
+    """Run a backend operation (on a worker thread, where the backend is created if needed)."""
+    return getattr(get_backend(), operation)(*args)
+
+
+def _read_as_json(operation: str, *args):
+    """Run a backend read and serialize its result (on the worker thread)."""
+    result = _call_backend(operation, *args)
+    return result, json.dumps(result, separators=(",", ":")) if result is not None else None
+
+
+def _read_plain(operation: str, *args):
+    """Run a backend read without serializing its result (on the worker thread)."""
+    return _call_backend(operation, *args), None
+
+
+async def _instrumented(operation: str, path: str, *args, as_json: bool = False):
+    """
+    Run a backend call on the worker pool and record it in the metrics (and the request
+    profile, if any). Reads return (result, result as JSON text); the text is only made
+    when as_json is set or the read has to be sized, for a sampled or profiled request,
+    as serializing a large result costs more than decoding it.
+    """
+    start = time.perf_counter()
+    try:
+        if operation in ("get", "get_range"):
+            sized = db_reads_sized() or is_profiling()
+            result = await _run_blocking(_read_as_json if as_json or sized else _read_plain, operation, path, *args)
+            downloaded_bytes = len(result[1]) if sized and result[1] is not None else 0
+        else:
+            result, downloaded_bytes = await _run_blocking(_call_backend, operation, path, *args), 0
+    except Exception:
+        record_db_call(operation, time.perf_counter() - start, failed=True)
+        record_db_timeline(operation, path, start, time.perf_counter() - start, failed=True)
+        raise
+
+    record_db_call(operation, time.perf_counter() - start, downloaded_bytes)
+    record_db_timeline(operation, path, start, time.perf_counter() - start, downloaded_bytes)
+    return result
+
+
+# Reads shared by everything running inside shared_reads(): (operation, path, query) -> _SharedRead
+_shared_reads = contextvars.ContextVar("shared_reads", default=None)
+
+
+@contextlib.contextmanager
+def shared_reads():
+    """
+    Deduplicate reads made inside this block, including by tasks it spawns: the first
+    caller fetches and later callers reuse the result instead of querying again, and
+    a get of a path inside an earlier get or unlimited get_range is served from it.
+    A write drops the shared reads of the paths it touches.
+    """
+    token = _shared_reads.set({})
+    try:
+        yield
+    finally:
+        _shared_reads.reset(token)
+
+
+def _child(node, key: str):
+    if isinstance(node, list):
+        return node[int(key)] if key.isdigit() and int(key) < len(node) else None
+    return node.get(key) if isinstance(node, dict) else None
+
+
+class _SharedRead:
+    """A read in flight (or done) inside shared_reads()."""
+
+    __slots__ = ("operation", "path", "args", "task", "_decoded")
+
+    def __init__(self, operation: str, path: str, args: tuple):
+        self.operation = operation
+        self.path = path
+        self.args = args
+        self.task = asyncio.ensure_future(_instrumented(operation, path, *args, as_json=True))
+        self._decoded = None
+
+    def relative_path(self, path: str) -> Optional[List[str]]:
+        """The keys leading from this read's result to `path`, or None if it doesn't contain it."""
+        if self.path and not path.startswith(self.path + "/"):
+            return None
+        keys = path[len(self.path):].strip("/").split("/")
+        if self.operation == "get":
+            return keys
+        start, end, limit_to_first, limit_to_last = self.args
+        if limit_to_first is not None or limit_to_last is not None:
+            return None
+        if (start is not None and keys[0] < start) or (end is not None and keys[0] > end):
+            return None
+        return keys
+
+    async def copy(self, keys: Sequence[str] = ()):
+        """
+        A private copy of the result, or of the node `keys` below it. Callers may modify
+        what they get back, so every later caller decodes its own.
+        """
+        _, text = await self.task
+        if text is None:
+            return None
+        if not keys:
+            return json.loads(text)
+
+        if self._decoded is None:
+            self._decoded = json.loads(text)
+        node = self._decoded
+        for key in keys:
+            node = _child(node, key)
+        return json.loads(json.dumps(node)) if node is not None else None
+
+
+def _paths_overlap(first: str, second: str) -> bool:
+    return not first or not second or first == second or \
+        first.startswith(second + "/") or second.startswith(first + "/")
+
+
+def _forget_shared_reads(written_paths):
+    shared = _shared_reads.get()
+    if not shared:
+        return
+    for key in [key for key, read in shared.items() if any(_paths_overlap(read.path, path) for path in written_paths)]:
+        del shared[key]
+
+
+# Helper class to wrap database operations with chaining
 class DatabaseReference:
-    def __init__(self, ref=None):
-        self.ref = ref if ref else db.reference()
+    def __init__(self, path=""):
+        self.path = path.strip("/")
 
     def child(self, path):
-        return DatabaseReference(self.ref.child(path))
+        return DatabaseReference(f"{self.path}/{path.strip('/')}" if self.path else path)
+
+    async def _read(self, operation: str, *args):
+        shared = _shared_reads.get()
+        if shared is None:
+            return (await _instrumented(operation, self.path, *args))[0]
+
+        key = (operation, self.path) + args
+        read = shared.get(key)
+        if read is not None:
+            return await read.copy()
 
-    def get(self):
-        return self.ref.get()
+        if operation == "get":
+            for covering in list(shared.values()):
+                keys = covering.relative_path(self.path)
+                if keys is not None:
+                    return await covering.copy(keys)
 
-    def set(self, data):
-        self.ref.set(data)
+        shared[key] = read = _SharedRead(operation, self.path, args)
+        return (await read.task)[0]
 
-    def update(self, data):
-        self.ref.update(data)
+    async def get(self):
+        return await self._read("get")
+
+    async def get_range(self, start=None, end=None, limit_to_first=None, limit_to_last=None):
+        """
+        Get the children whose keys fall between start and end (inclusive) in a single query.
+
+        limit_to_first/limit_to_last cap the result to the first or last N keys of that range.
+        """
+        return await self._read("get_range", start, end, limit_to_first, limit_to_last)
+
+    async def set(self, data):
+        _forget_shared_reads([self.path])
+        await _instrumented("set", self.path, data)
+
+    async def update(self, data):
+        _forget_shared_reads([f"{self.path}/{key.strip('/')}".strip("/") for key in data])
+        await _instrumented("update", self.path, data)
+
+    async def listen(self, callback):
+        """
+        Follow changes under this path: callback(event_type, path, data) is called from a
+        background thread with the current value and then every change. Returns a
+        registration; pass it to stop_listening().
+        """
+        return await _run_blocking(_call_backend, "listen", self.path, callback)
 
 
 # Database reference wrapper
 database = DatabaseReference()
 
 
+async def warm_up():
+    """
+    Create the storage backend, start the worker threads and make a first (tiny) read,
+    so the first requests don't pay for credential loading, thread start-up and the
+    initial connection and token fetch.
+    """
+    await _run_blocking(get_backend)
+    await asyncio.gather(*(_run_blocking(time.sleep, 0.01) for _ in range(DATABASE_POOL_SIZE)))
+    await database.child("warmup").get()
+
+
+async def stop_listening(registration):
+    """Close a registration returned by DatabaseReference.listen()."""
+    await _run_blocking(registration.close)
+
+
+def shutdown():
+    _executor.shutdown(wait=False)
+
+
 # Function to check if a user exists
-def user_exists(username):
-    user_data = database.child('user_details').child(username).get()
+async def user_exists(username):
+    user_data = await database.child('user_details').child(username).get()
     return user_data is not None
 
 
 # Function to create a user
-def create_user_in_db(username, user_data):
-    database.child('user_details').child(username).set(user_data)
+async def create_user_in_db(username, user_data):
+    await database.child('user_details').child(username).set(user_data)
 
 
 # Function to get user
-def get_user(username):
-    return database.child('user_details').child(username).get()
+async def get_user(username):
+    return await database.child('user_details').child(username).get()
 
 #Function to get product_id
-def get_product_id(username):
-    return database.child('user_details').child(username).child('product_id').get()
\ No newline at end of file
+async def get_product_id(username):
+    return await database.child('user_details').child(username).child('product_id').get()
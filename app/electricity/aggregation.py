@@ -0,0 +1,229 @@
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+MINUTES_PER_HOUR = 60
+HOURS_PER_DAY = 24
+
+
+class BucketStats(NamedTuple):
+    """Per-bucket sum, count, min and max; min/max are NaN for buckets without readings."""
+    sum: np.ndarray
+    count: np.ndarray
+    min: np.ndarray
+    max: np.ndarray
+
+
+def _to_float(value) -> float:
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return np.nan
+
+
+# Values converted per NumPy call: 16 hours, so something that isn't a number only
+# sends its own block down the slow path
+_CONVERT_BLOCK_SIZE = 16 * MINUTES_PER_HOUR
+
+
+def _to_float_values(values: list, out: np.ndarray):
+    """
+    Convert a flat list of hours of minute values into out, with NaN for nulls and
+    anything that isn't a number.
+
+    Numbers, numeric strings and nulls convert a block at a time. A block that fails
+    is converted an hour at a time, and only an hour that fails goes value by value.
+    """
+    for start in range(0, len(values), _CONVERT_BLOCK_SIZE):
+        end = start + _CONVERT_BLOCK_SIZE
+        try:
+            out[start:end] = values[start:end]
+            continue
+        except (ValueError, TypeError):
+            pass
+
+        for hour in range(start, min(end, len(values)), MINUTES_PER_HOUR):
+            hour_values = values[hour:hour + MINUTES_PER_HOUR]
+            try:
+                out[hour:hour + MINUTES_PER_HOUR] = hour_values
+            except (ValueError, TypeError):
+                out[hour:hour + MINUTES_PER_HOUR] = [_to_float(value) for value in hour_values]
+
+
+# Minute keys of an hour in object format, and the minute or hour each spelling of one stands for
+_MINUTE_KEYS = [f"{minute:02d}" for minute in range(MINUTES_PER_HOUR)]
+_MINUTE_INDEX = {**{str(minute): minute for minute in range(MINUTES_PER_HOUR)},
+                 **{key: minute for minute, key in enumerate(_MINUTE_KEYS)}}
+_MINUTE_KEY_SET = frozenset(_MINUTE_KEYS)
+_HOUR_INDEX = {key: index for key, index in _MINUTE_INDEX.items() if index < HOURS_PER_DAY}
+
+# Padding for hours in array format with fewer than 60 minutes
+_NO_MINUTES = [None] * MINUTES_PER_HOUR
+
+
+def _key_index(key: str, size: int) -> Optional[int]:
+    """The hour or minute a key stands for, if it's a number below size."""
+    index = _MINUTE_INDEX.get(key)
+    if index is None and key.isdigit():
+        index = int(key)
+    return index if index is not None and index < size else None
+
+
+def _extend_minutes(values: list, hour_data, slot: int, off_grid: List[Tuple[int, object]]) -> bool:
+    """
+    Append one hour of raw data to values as 60 values indexed by minute. Values that
+    don't sit at a minute of the hour (keys that aren't 0-59, array entries past 59)
+    are appended to off_grid with the hour's slot instead. Returns False if the hour
+    isn't minute data.
+    """
+    if isinstance(hour_data, list):
+        values.extend(hour_data[:MINUTES_PER_HOUR])
+        values.extend(_NO_MINUTES[len(hour_data):])
+        off_grid.extend((slot, value) for value in hour_data[MINUTES_PER_HOUR:])
+        return True
+
+    if not isinstance(hour_data, dict):
+        return False
+
+    if hour_data.keys() <= _MINUTE_KEY_SET:
+        # Some minutes missing, as Firebase leaves out nulls
+        values.extend(map(hour_data.get, _MINUTE_KEYS))
+        return True
+
+    row = [None] * MINUTES_PER_HOUR
+    for key, value in hour_data.items():
+        minute = _key_index(key, MINUTES_PER_HOUR)
+        if minute is None or row[minute] is not None:
+            off_grid.append((slot, value))
+        else:
+            row[minute] = value
+    values.extend(row)
+    return True
+
+
+def _off_grid_stats(off_grid: List[Tuple[int, object]], size: int) -> Optional[BucketStats]:
+    """Per-slot stats of values that have no minute, or None if there are no valid ones."""
+    slots, values = zip(*off_grid)
+    converted = np.empty(len(values))
+    _to_float_values(list(values), converted)
+    valid = ~np.isnan(converted)
+    if not valid.any():
+        return None
+
+    slots = np.asarray(slots)[valid]
+    converted = converted[valid]
+    minimum = np.full(size, np.nan)
+    maximum = np.full(size, np.nan)
+    np.fmin.at(minimum, slots, converted)
+    np.fmax.at(maximum, slots, converted)
+    return BucketStats(
+        sum=np.bincount(slots, weights=converted, minlength=size),
+        count=np.bincount(slots, minlength=size),
+        min=minimum,
+        max=maximum
+    )
+
+
+def decode_days(days: Iterable, out: np.ndarray = None) -> Tuple[np.ndarray, Optional[BucketStats]]:
+    """
+    Decode days of raw minute data into a (days, 24, 60) array indexed by day, hour and minute.
+
+    Handles both the object format (hour/minute: value) and the array format Firebase
+    produces for numeric keys, for days as well as hours. Missing and invalid minutes
+    are NaN. Every hour is laid out as 60 values of one flat list, copied straight from
+    the payload when the hour is complete, and the whole list is converted with a
+    single NumPy call.
+
+    Readings that have no minute of their own (minute keys other than 0-59, array
+    hours longer than 60) are still readings of their hour: they are returned as
+    per-hour stats of shape (days, 24), or None if there are none.
+
+    out can be a preallocated NaN-filled array of the right shape (of any float dtype)
+    to decode into.
+    """
+    days = list(days)
+    if out is None:
+        out = np.full((len(days), HOURS_PER_DAY, MINUTES_PER_HOUR), np.nan)
+    hour_rows = out.reshape(len(days) * HOURS_PER_DAY, MINUTES_PER_HOUR)
+
+    slots = []
+    values = []
+    off_grid = []
+    # JSON decoding shares key strings across a payload, so once one complete hour has
+    # matched the standard keys by value, comparing its keys to the others is by identity
+    minute_keys = _MINUTE_KEYS
+    for day_index, day_data in enumerate(days):
+        if isinstance(day_data, list):
+            # Firebase returns a day as an array when its hour keys look like array indices
+            day_data = {str(hour): hour_data for hour, hour_data in enumerate(day_data[:HOURS_PER_DAY])}
+        elif not isinstance(day_data, dict):
+            continue
+
+        day_slot = day_index * HOURS_PER_DAY
+        for hour, hour_data in day_data.items():
+            hour_index = _HOUR_INDEX.get(hour)
+            if hour_index is None:
+                # Skip non-hour keys like "connection_status"
+                hour_index = _key_index(hour, HOURS_PER_DAY)
+                if hour_index is None:
+                    continue
+
+            if type(hour_data) is list and len(hour_data) == MINUTES_PER_HOUR:
+                values.extend(hour_data)
+            elif type(hour_data) is dict and len(hour_data) == MINUTES_PER_HOUR and list(hour_data) == minute_keys:
+                # Every minute, in order
+                if minute_keys is _MINUTE_KEYS:
+                    minute_keys = list(hour_data)
+                values.extend(hour_data.values())
+            elif not _extend_minutes(values, hour_data, day_slot + hour_index, off_grid):
+                continue
+            slots.append(day_slot + hour_index)
+
+    if slots:
+        converted = np.empty(len(values))
+        _to_float_values(values, converted)
+        hour_rows[slots] = converted.reshape(len(slots), MINUTES_PER_HOUR)
+
+    extra = None
+    if off_grid:
+        extra = _off_grid_stats(off_grid, len(days) * HOURS_PER_DAY)
+        if extra is not None:
+            extra = BucketStats(*(stat.reshape(len(days), HOURS_PER_DAY) for stat in extra))
+
+    return out, extra
+
+
+def decode_hour(hour_data) -> np.ndarray:
+    """Decode one hour of raw minute data into a 60-slot array indexed by minute."""
+    return decode_days([{"00": hour_data}])[0][0, 0]
+
+
+def bucket_stats(values: np.ndarray, axis=-1, valid: np.ndarray = None) -> BucketStats:
+    """
+    Compute sum, count, min and max over an axis (or tuple of axes), ignoring NaN slots.
+
+    valid can pass in a precomputed validity mask for the values.
+    """
+    if valid is None:
+        valid = ~np.isnan(values)
+    return BucketStats(
+        sum=np.where(valid, values, 0.0).sum(axis=axis, dtype=np.float64),
+        count=valid.sum(axis=axis),
+        min=np.fmin.reduce(values, axis=axis),
+        max=np.fmax.reduce(values, axis=axis)
+    )
+
+
+def merge_stats(stats: BucketStats, other: Optional[BucketStats]) -> BucketStats:
+    """Combine two sets of bucket stats of the same shape."""
+    if other is None:
+        return stats
+    return BucketStats(
+        sum=stats.sum + other.sum,
+        count=stats.count + other.count,
+        min=np.fmin(stats.min, other.min),
+        max=np.fmax(stats.max, other.max)
+    )
@@ -0,0 +1,106 @@
+import asyncio
+import re
+import sys
+import time
+from datetime import datetime
+from typing import Optional
+
+from fastapi.logger import logger
+
+from app.config import BILLING_CONCURRENCY
+from app.core.exceptions import BadRequestError
+from app.db.firebase import database
+from app.electricity.models import BillingRunResponse
+from app.electricity.periods import is_period_closed, previous_month
+from app.electricity.service import ElectricityUsageService
+
+
+# Bill snapshots are stored on the user record so /electricity/bill/{username}
+# can answer from the single user read it already does:
+#   user_details/{username}/bills/{YYYY-MM} = {product_id, total_kwh, amount, generated_at}
+def bill_snapshot_path(username: str, year_month: str) -> str:
+    return f"user_details/{username}/bills/{year_month}"
+
+
+# A billing month, "YYYY-MM"; it becomes part of the path every bill is written to
+YEAR_MONTH_PATTERN = re.compile(r"\d{4}-(0[1-9]|1[0-2])")
+
+
+class BillingService:
+    @staticmethod
+    def validate(year_month: Optional[str]) -> str:
+        """Check the month of a billing run (last month if None); only months that have ended can be billed."""
+        if year_month is None:
+            return previous_month()
+        if not YEAR_MONTH_PATTERN.fullmatch(year_month):
+            raise BadRequestError("year_month must be a month in YYYY-MM format")
+        if not is_period_closed(year_month):
+            raise BadRequestError(f"{year_month} has not ended yet")
+        return year_month
+
+    @staticmethod
+    async def _compute_bill(username: str, product_id: str, year_month: str, semaphore: asyncio.Semaphore) -> dict:
+        # Raises when the usage can't be read, so the user is reported as failed and no bill is stored
+        async with semaphore:
+            total_kwh = await ElectricityUsageService.compute_total_kwh_for_month(product_id, year_month)
+
+        return {
+            "product_id": product_id,
+            "total_kwh": total_kwh,
+            "amount": ElectricityUsageService.calculate_billing_tiers(total_kwh),
+            "generated_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    @staticmethod
+    async def run_billing(year_month: Optional[str] = None) -> BillingRunResponse:
+        """
+        Generate and store the bills of every user for a month (last month by default).
+
+        kWh totals for all products are computed concurrently, and all bill snapshots are
+        written back in one multi-path update.
+        """
+        year_month = BillingService.validate(year_month)
+        started = time.perf_counter()
+
+        users_data = await database.child("user_details").get() or {}
+
+        users = [
+            (username, user_data["product_id"])
+            for username, user_data in users_data.items()
+            if isinstance(user_data, dict) and user_data.get("product_id")
+        ]
+
+        semaphore = asyncio.Semaphore(BILLING_CONCURRENCY)
+        results = await asyncio.gather(
+            *(BillingService._compute_bill(username, product_id, year_month, semaphore)
+              for username, product_id in users),
+            return_exceptions=True
+        )
+
+        updates = {}
+        failed = []
+        for (username, product_id), result in zip(users, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error generating bill for {username}: {str(result)}")
+                failed.append(username)
+                continue
+            updates[bill_snapshot_path(username, year_month)] = result
+
+        if updates:
+            await database.update(updates)
+
+        duration = time.perf_counter() - started
+        logger.info(f"Billing run for {year_month}: {len(updates)} bills generated, {len(failed)} failed in {duration:.1f}s")
+
+        return BillingRunResponse(
+            year_month=year_month,
+            bills_generated=len(updates),
+            failed=failed,
+            duration_seconds=round(duration, 2)
+        )
+
+
+if __name__ == "__main__":
+    # Batch job: python -m app.electricity.billing [YYYY-MM]
+    result = asyncio.run(BillingService.run_billing(sys.argv[1] if len(sys.argv) > 1 else None))
+    print(result.model_dump_json(indent=2))
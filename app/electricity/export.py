@@ -0,0 +1,115 @@
+import asyncio
+import contextlib
+import json
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List
+
+import numpy as np
+from fastapi.logger import logger
+
+from app.config import EXPORT_CHUNK_DAYS, EXPORT_MAX_DAYS
+from app.core.exceptions import BadRequestError
+from app.db.firebase import database
+from app.electricity.timeseries import DaySeries
+
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _date_range(start: str, end: str) -> List[str]:
+    """Every date from start to end inclusive as "YYYY-MM-DD", validating the range."""
+    try:
+        first = datetime.strptime(start, "%Y-%m-%d")
+        last = datetime.strptime(end, "%Y-%m-%d")
+    except ValueError:
+        raise BadRequestError("start and end must be dates in YYYY-MM-DD format")
+
+    if last < first:
+        raise BadRequestError("end must not be before start")
+
+    days = (last - first).days + 1
+    if days > EXPORT_MAX_DAYS:
+        raise BadRequestError(f"An export can cover at most {EXPORT_MAX_DAYS} days")
+
+    return [(first + timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(days)]
+
+
+def _format_day(series: DaySeries, export_format: str) -> str:
+    """Render one day's valid readings as NDJSON or CSV lines."""
+    if export_format == "csv":
+        return "".join(f"{series.date}T{minute}:00,{watts}\n" for minute, watts in series.readings())
+
+    return "".join(
+        json.dumps({"timestamp": f"{series.date}T{minute}:00", "watts": watts}) + "\n"
+        for minute, watts in series.readings()
+    )
+
+
+def _format_error(date_str: str, export_format: str) -> str:
+    """
+    The last line of an export cut short by a failed read, so it can't pass for a complete
+    one: an "error" row in CSV, an object with an "error" key in NDJSON.
+    """
+    message = f"export truncated: readings from {date_str} on could not be read"
+    if export_format == "csv":
+        return f"error,{message}\n"
+    return json.dumps({"error": message}) + "\n"
+
+
+class ExportService:
+    @staticmethod
+    def validate(start: str, end: str, export_format: str) -> List[str]:
+        """Check an export request up front, so errors are reported before streaming starts."""
+        if export_format not in EXPORT_FORMATS:
+            raise BadRequestError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+        return _date_range(start, end)
+
+    @staticmethod
+    async def stream_readings(product_id: str, dates: List[str], export_format: str) -> AsyncIterator[str]:
+        """
+        Yield the raw minute readings of a product over the given dates, oldest first.
+
+        Days are fetched EXPORT_CHUNK_DAYS at a time with one range query, and the next
+        chunk is requested while the current one is being decoded and sent, so memory
+        stays bounded by a chunk whatever the length of the range. If a read fails the
+        export ends with an error line.
+        """
+        if export_format == "csv":
+            yield "timestamp,watts\n"
+
+        ref = database.child(f"electricity_usage/{product_id}")
+        chunks = [dates[index:index + EXPORT_CHUNK_DAYS] for index in range(0, len(dates), EXPORT_CHUNK_DAYS)]
+
+        next_fetch = asyncio.ensure_future(ref.get_range(start=chunks[0][0], end=chunks[0][-1]))
+        unsent = dates[0]  # First day not sent yet
+        try:
+            for index, chunk in enumerate(chunks):
+                unsent = chunk[0]
+                payload = await next_fetch or {}
+                if index + 1 < len(chunks):
+                    following = chunks[index + 1]
+                    next_fetch = asyncio.ensure_future(ref.get_range(start=following[0], end=following[-1]))
+
+                for date_str in chunk:
+                    unsent = date_str
+                    # Drop each day from the payload once decoded so it can be freed
+                    day_data = payload.pop(date_str, None)
+                    if not day_data:
+                        continue
+
+                    # Decoded at full precision so the exported values are the stored ones
+                    lines = _format_day(DaySeries.from_payload(date_str, day_data, dtype=np.float64), export_format)
+                    if lines:
+                        yield lines
+        except Exception as e:
+            # The response has already started, so the stream can only be cut short, and say so
+            logger.error(f"Error exporting readings for {product_id}: {str(e)}")
+            yield _format_error(unsent, export_format)
+        finally:
+            # Await the prefetch too, so a cancelled or failed read isn't reported as never retrieved
+            next_fetch.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await next_fetch
@@ -0,0 +1,114 @@
+import base64
+import binascii
+import json
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import FLEET_STATUS_MAX_PAGE_SIZE
+from app.core.exceptions import BadRequestError
+from app.electricity.last_seen import format_last_seen
+from app.electricity.models import UserProductStatus
+
+
+# Paging of the fleet connection status endpoint. Users are ordered by a sort key and
+# then by username, which is unique, so every user has a fixed position and a cursor
+# (the sort key and username of the last user sent) says exactly where the next page
+# starts, even when users are added or change status between pages.
+
+# Sort key of each sort option; last_active strings sort chronologically and devices
+# never heard from sort first
+SORT_KEYS: Dict[str, Callable[[UserProductStatus], str]] = {
+    "username": lambda user: user.username,
+    "product_id": lambda user: user.product_id,
+    "last_active": lambda user: user.last_active or "",
+    "connection_status": lambda user: "1" if user.connection_status else "0",
+}
+
+SORT_ORDERS = ("asc", "desc")
+
+STATUS_FILTERS = ("online", "offline")
+
+# (sort key, username) of a user
+Position = Tuple[str, str]
+
+
+def _position(user: UserProductStatus, sort: str) -> Position:
+    return SORT_KEYS[sort](user), user.username
+
+
+def encode_cursor(position: Position, sort: str, order: str) -> str:
+    """An opaque cursor for the page after the user at position."""
+    token = json.dumps([sort, order, *position], separators=(",", ":"))
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, order: str) -> Position:
+    """The position in a cursor, which must come from a page with the same sort and order."""
+    try:
+        token = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, cursor_order, key, username = json.loads(token)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise BadRequestError("Invalid cursor")
+
+    if (cursor_sort, cursor_order) != (sort, order):
+        raise BadRequestError("The cursor belongs to a listing with a different sort or order")
+    if not isinstance(key, str) or not isinstance(username, str):
+        raise BadRequestError("Invalid cursor")
+    return key, username
+
+
+class FleetStatusService:
+    @staticmethod
+    def validate(status: Optional[str], sort: str, order: str, limit: Optional[int],
+                 cursor: Optional[str]) -> Optional[Position]:
+        """Check a listing request up front and return the position its cursor points at, if any."""
+        if status is not None and status not in STATUS_FILTERS:
+            raise BadRequestError(f"status must be one of: {', '.join(STATUS_FILTERS)}")
+        if sort not in SORT_KEYS:
+            raise BadRequestError(f"sort must be one of: {', '.join(SORT_KEYS)}")
+        if order not in SORT_ORDERS:
+            raise BadRequestError(f"order must be one of: {', '.join(SORT_ORDERS)}")
+        if limit is not None and not 1 <= limit <= FLEET_STATUS_MAX_PAGE_SIZE:
+            raise BadRequestError(f"limit must be between 1 and {FLEET_STATUS_MAX_PAGE_SIZE}")
+        return decode_cursor(cursor, sort, order) if cursor else None
+
+    @staticmethod
+    def filter_users(users: List[UserProductStatus], status: Optional[str],
+                     last_active_before: Optional[datetime]) -> List[UserProductStatus]:
+        """
+        The users whose device is online or offline, as status asks, and that haven't been
+        active since last_active_before (devices never heard from included).
+        """
+        if status is not None:
+            online = status == "online"
+            users = [user for user in users if user.connection_status == online]
+        if last_active_before is not None:
+            if last_active_before.tzinfo is not None:
+                last_active_before = last_active_before.astimezone(timezone.utc).replace(tzinfo=None)
+            before = format_last_seen(last_active_before)
+            users = [user for user in users if not user.last_active or user.last_active < before]
+        return users
+
+    @staticmethod
+    def page(users: List[UserProductStatus], sort: str, order: str, limit: Optional[int],
+             after: Optional[Position]) -> Tuple[List[UserProductStatus], Optional[str]]:
+        """
+        The sorted page of users following the position after (from the start if None),
+        at most limit users long, and the cursor of the next page (None on the last page).
+        """
+        users = sorted(users, key=lambda user: _position(user, sort))
+        positions = [_position(user, sort) for user in users]
+
+        if order == "asc":
+            start = bisect_right(positions, after) if after is not None else 0
+            remaining = users[start:]
+        else:
+            end = bisect_left(positions, after) if after is not None else len(users)
+            remaining = users[:end][::-1]
+
+        if limit is None or len(remaining) <= limit:
+            return remaining, None
+
+        page = remaining[:limit]
+        return page, encode_cursor(_position(page[-1], sort), sort, order)
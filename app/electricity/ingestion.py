@@ -0,0 +1,158 @@
+import asyncio
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+from fastapi.logger import logger
+
+from app.config import INGEST_MAX_READINGS, INGEST_MAX_PATHS_PER_WRITE, PRESENCE_TTL_SECONDS
+from app.core.cache import result_cache
+from app.core.exceptions import BadRequestError
+from app.db.firebase import database
+from app.electricity.last_seen import last_seen_path, format_last_seen, parse_last_seen
+from app.electricity.models import MeterReading, ReadingBatchResponse
+from app.electricity.presence import presence_registry
+from app.electricity.ranges import RangeService
+from app.electricity.rollups import RollupService
+from app.electricity.status_buffer import connection_status_buffer
+
+
+# Readings stamped further than this into the future are rejected
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+
+def _to_utc_minute(timestamp: datetime) -> datetime:
+    """Normalise a reading timestamp to a naive UTC datetime truncated to the minute."""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def _reading_path(product_id: str, timestamp: datetime) -> str:
+    return f"electricity_usage/{product_id}/{timestamp:%Y-%m-%d}/{timestamp:%H}/{timestamp:%M}"
+
+
+class IngestionService:
+    @staticmethod
+    def _validate(readings: List[MeterReading]) -> Tuple[Dict[str, Dict[datetime, float]], List[str]]:
+        """
+        Validate a batch once and group it by product.
+
+        Returns {product_id: {minute: watts}} plus an error message per rejected reading.
+        A minute sent more than once keeps its last value.
+        """
+        latest_allowed = datetime.utcnow() + MAX_CLOCK_SKEW
+        grouped: Dict[str, Dict[datetime, float]] = {}
+        errors = []
+
+        for index, reading in enumerate(readings):
+            product_id = reading.product_id.strip()
+            if not product_id or any(char in product_id for char in ".$#[]/"):
+                errors.append(f"Reading {index}: invalid product_id '{reading.product_id}'")
+                continue
+
+            if not math.isfinite(reading.watts) or reading.watts < 0:
+                errors.append(f"Reading {index}: invalid watts value {reading.watts}")
+                continue
+
+            timestamp = _to_utc_minute(reading.timestamp)
+            if timestamp > latest_allowed:
+                errors.append(f"Reading {index}: timestamp {reading.timestamp.isoformat()} is in the future")
+                continue
+
+            grouped.setdefault(product_id, {})[timestamp] = reading.watts
+
+        return grouped, errors
+
+    @staticmethod
+    def _is_current(minutes: Dict[datetime, float], now: datetime) -> bool:
+        """Whether a product's readings show it online now, rather than being a backfill of old ones."""
+        return now - max(minutes) <= timedelta(seconds=PRESENCE_TTL_SECONDS)
+
+    @staticmethod
+    async def _product_updates(product_id: str, minutes: Dict[datetime, float], now: datetime) -> dict:
+        """Raw readings, rollups, connection status and last-seen time of one product as a multi-path update."""
+        stored_last_seen = await database.child(last_seen_path(product_id)).get()
+        updates = {_reading_path(product_id, timestamp): watts for timestamp, watts in minutes.items()}
+        updates.update(RollupService.build_rollup_updates(product_id, minutes))
+
+        # The device was last seen at its newest reading, unless the index already has a later time
+        newest = max(minutes)
+        last_seen = parse_last_seen(stored_last_seen)
+        if last_seen is None or newest > last_seen:
+            updates[last_seen_path(product_id)] = format_last_seen(newest)
+
+        # Only a device uploading current readings is online
+        if IngestionService._is_current(minutes, now):
+            updates[f"electricity_usage/{product_id}/connection_status"] = True
+        return updates
+
+    @staticmethod
+    def _invalidate_cached_results(product_id: str, minutes: Dict[datetime, float]):
+        """Drop cached charts and totals covering the periods the new readings fall in."""
+        RangeService.invalidate(product_id)
+        for timestamp in minutes:
+            result_cache.delete((product_id, "minutely", f"{timestamp:%Y-%m-%d %H}"))
+            result_cache.delete((product_id, "hourly", f"{timestamp:%Y-%m-%d}"))
+            result_cache.delete((product_id, "daily", f"{timestamp:%Y-%m}"))
+            result_cache.delete((product_id, "total_kwh", f"{timestamp:%Y-%m}"))
+            result_cache.delete((product_id, "monthly", f"{timestamp:%Y}"))
+
+    @staticmethod
+    async def ingest_readings(readings: List[MeterReading]) -> ReadingBatchResponse:
+        """
+        Store a batch of meter readings.
+
+        Readings are validated once, grouped by product and written together with their
+        rollups, connection status and last-seen time in as few multi-path updates as
+        INGEST_MAX_PATHS_PER_WRITE allows.
+        """
+        if len(readings) > INGEST_MAX_READINGS:
+            raise BadRequestError(f"A batch can hold at most {INGEST_MAX_READINGS} readings")
+
+        grouped, errors = IngestionService._validate(readings)
+        accepted = sum(len(minutes) for minutes in grouped.values())
+        now = datetime.utcnow()
+
+        # Build every product's updates concurrently (each needs a few reads)
+        product_updates = await asyncio.gather(
+            *(IngestionService._product_updates(product_id, minutes, now) for product_id, minutes in grouped.items())
+        )
+
+        # Flush in chunks of whole products so each product's readings and rollups land together
+        writes = 0
+        pending = {}
+        for updates in product_updates:
+            if pending and len(pending) + len(updates) > INGEST_MAX_PATHS_PER_WRITE:
+                await database.update(pending)
+                writes += 1
+                pending = {}
+            pending.update(updates)
+
+        if pending:
+            await database.update(pending)
+            writes += 1
+
+        # Products with current readings were just marked connected; buffered status updates from
+        # before must not overwrite that. Backfills only move the last-seen time forward.
+        online = {product_id for product_id, minutes in grouped.items() if IngestionService._is_current(minutes, now)}
+        connection_status_buffer.discard(online)
+        for product_id, minutes in grouped.items():
+            if product_id in online:
+                presence_registry.report(product_id, True, now, last_seen=max(minutes))
+            else:
+                presence_registry.saw(product_id, max(minutes))
+
+        for product_id, minutes in grouped.items():
+            IngestionService._invalidate_cached_results(product_id, minutes)
+
+        if errors:
+            logger.warning(f"Rejected {len(errors)} of {len(readings)} readings in batch")
+
+        return ReadingBatchResponse(
+            accepted=accepted,
+            rejected=len(errors),
+            products=len(grouped),
+            writes=writes,
+            errors=errors
+        )
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from fastapi.logger import logger
+
+from app.db.firebase import database
+from app.electricity.timeseries import DaySeries
+
+
+# Per-product index of the last time a device was heard from:
+#   last_seen/{product_id} = "YYYY-MM-DD HH:MM"
+# It's written alongside readings and connection status updates so the fleet
+# status endpoint never has to scan a product's usage history.
+LAST_SEEN_ROOT = "last_seen"
+LAST_SEEN_FORMAT = "%Y-%m-%d %H:%M"
+
+# Upper bound for date keys; keeps non-date keys like "connection_status" out of range queries
+_LAST_DATE_KEY = "9999-12-31"
+
+
+def last_seen_path(product_id: str) -> str:
+    return f"{LAST_SEEN_ROOT}/{product_id}"
+
+
+def format_last_seen(timestamp: datetime) -> str:
+    return timestamp.strftime(LAST_SEEN_FORMAT)
+
+
+def parse_last_seen(value) -> Optional[datetime]:
+    """The time in a last-seen index entry, or None if it isn't one."""
+    try:
+        return datetime.strptime(value, LAST_SEEN_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def latest_minute_in_day(date_str: str, day_data) -> Optional[str]:
+    """Find the most recent minute with data in a day's raw readings."""
+    latest_minute = DaySeries.from_payload(date_str, day_data).latest_minute()
+    if latest_minute is None:
+        return None
+    return f"{date_str} {latest_minute}"
+
+
+async def find_latest_reading(product_id: str) -> Optional[str]:
+    """Find the latest reading of a product from its raw data, reading only the most recent day."""
+    latest_day = await database.child(f"electricity_usage/{product_id}").get_range(
+        end=_LAST_DATE_KEY,
+        limit_to_last=1
+    ) or {}
+
+    for date_str, day_data in latest_day.items():
+        return latest_minute_in_day(date_str, day_data)
+    return None
+
+
+async def get_last_seen(product_id: str) -> Optional[str]:
+    """Read the last-seen time of a product, rebuilding the index entry from raw data if it's missing."""
+    last_seen = await database.child(last_seen_path(product_id)).get()
+    if last_seen is not None:
+        return last_seen
+
+    last_seen = await find_latest_reading(product_id)
+    if last_seen is not None:
+        await database.child(last_seen_path(product_id)).set(last_seen)
+    return last_seen
+
+
+async def backfill_last_seen() -> int:
+    """Populate the last-seen index for every product that has a user. Returns the number of entries written."""
+    users_data = await database.child("user_details").get() or {}
+
+    product_ids = {
+        user_data.get("product_id")
+        for user_data in users_data.values()
+        if isinstance(user_data, dict) and user_data.get("product_id")
+    }
+
+    written = 0
+    for product_id in sorted(product_ids):
+        try:
+            last_seen = await find_latest_reading(product_id)
+            if last_seen is None:
+                continue
+            await database.child(last_seen_path(product_id)).set(last_seen)
+            written += 1
+        except Exception as e:
+            logger.warning(f"Error backfilling last seen time for {product_id}: {str(e)}")
+
+    return written
+
+
+if __name__ == "__main__":
+    # One-off job: python -m app.electricity.last_seen
+    count = asyncio.run(backfill_last_seen())
+    print(f"Backfilled last seen time for {count} products")
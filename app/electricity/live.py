@@ -0,0 +1,231 @@
+import asyncio
+import contextlib
+import itertools
+import json
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from fastapi.logger import logger
+
+from app.config import LIVE_QUEUE_SIZE, LIVE_IDLE_SECONDS, LIVE_HEARTBEAT_SECONDS
+from app.core.metrics import live_dropped_readings, live_listeners, live_subscribers
+from app.db.firebase import database, stop_listening
+from app.electricity.timeseries import DaySeries
+
+
+# Live usage streams. Every product being watched has one upstream listener on the
+# raw readings of the current UTC day,
+#   electricity_usage/{product_id}/{YYYY-MM-DD}
+# moved to the next day at midnight, and each new reading it reports is pushed to
+# every client streaming that product. A listener is closed LIVE_IDLE_SECONDS after
+# its last client leaves, so clients that reconnect right away keep it.
+
+# Seconds before retrying to move a listener to the next day after a failure
+ROLLOVER_RETRY_SECONDS = 30
+
+# ("YYYY-MM-DDTHH:MM:00", watts)
+Reading = Tuple[str, float]
+
+
+def _event_readings(date_str: str, path: str, data) -> List[Reading]:
+    """The readings in a change event on a day node, whose path is "/", "/HH" or "/HH/MM"."""
+    parts = [part for part in path.split("/") if part]
+    if data is None or len(parts) > 2:
+        return []
+
+    # Rebuild the day payload the event describes
+    for part in reversed(parts):
+        data = {part: data}
+    # Decoded at full precision so clients get the stored values
+    series = DaySeries.from_payload(date_str, data, dtype=np.float64)
+    return [(f"{date_str}T{minute}:00", watts) for minute, watts in series.readings()]
+
+
+def _format_event(reading: Reading) -> str:
+    timestamp, watts = reading
+    return f"event: reading\ndata: {json.dumps({'timestamp': timestamp, 'watts': watts})}\n\n"
+
+
+class LiveSubscription:
+    """A client's queue of new readings. When the client falls behind, its oldest readings are dropped."""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+
+    def push(self, reading: Reading):
+        if self.queue.full():
+            self.queue.get_nowait()
+            live_dropped_readings.inc()
+        self.queue.put_nowait(reading)
+
+
+class _ProductFeed:
+    """The upstream listener of one product and the clients it is fanned out to."""
+
+    def __init__(self, product_id: str):
+        self.product_id = product_id
+        self.subscribers: Set[LiveSubscription] = set()
+        self.latest: Optional[Reading] = None
+        self.primed = False  # Whether the first day's current value has arrived
+        self.idle_timer: Optional[asyncio.TimerHandle] = None
+
+        self._loop = asyncio.get_running_loop()
+        self._registration = None
+        self._started: Optional[asyncio.Future] = None
+        self._rollover: Optional[asyncio.TimerHandle] = None
+        self._closed = False
+
+    async def start(self):
+        """Start listening, once; concurrent callers wait for the same start."""
+        if self._started is None:
+            self._started = asyncio.ensure_future(self._listen(datetime.utcnow().strftime("%Y-%m-%d")))
+        started = self._started
+        try:
+            await asyncio.shield(started)
+        except Exception:
+            # Let the next client try again
+            if self._started is started:
+                self._started = None
+            raise
+
+    async def _listen(self, date_str: str):
+        """Listen to a day's readings, replacing the listener of the previous day if any."""
+        events = itertools.count()
+
+        def on_event(event_type, path, data):
+            # Called on the backend's thread; the first event is the day's current value
+            self._loop.call_soon_threadsafe(self._on_event, date_str, path, data, next(events) == 0)
+
+        registration = await database.child(f"electricity_usage/{self.product_id}/{date_str}").listen(on_event)
+        if self._closed:
+            await stop_listening(registration)
+            return
+
+        previous, self._registration = self._registration, registration
+        if previous is None:
+            live_listeners.inc()
+        else:
+            await self._stop(previous)
+
+        now = datetime.utcnow()
+        next_day = datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)
+        delay = max((next_day - now).total_seconds(), 0) + 1
+        self._rollover = self._loop.call_later(delay, self._schedule_rollover)
+
+    def _schedule_rollover(self):
+        asyncio.ensure_future(self._roll_over())
+
+    async def _roll_over(self):
+        try:
+            await self._listen(datetime.utcnow().strftime("%Y-%m-%d"))
+        except Exception as e:
+            logger.error(f"Error moving the live listener of {self.product_id} to the next day: {str(e)}")
+            if not self._closed:
+                self._rollover = self._loop.call_later(ROLLOVER_RETRY_SECONDS, self._schedule_rollover)
+
+    def _on_event(self, date_str: str, path: str, data, snapshot: bool):
+        readings = _event_readings(date_str, path, data)
+        if snapshot and not self.primed:
+            # The feed has just started: only the newest reading is sent, to the clients waiting for it
+            self.primed = True
+            if readings:
+                self.latest = readings[-1]
+                for subscription in self.subscribers:
+                    subscription.push(self.latest)
+            return
+        if snapshot and self.latest is not None:
+            # The next day's current value: only readings newer than the last one sent are new
+            readings = [reading for reading in readings if reading[0] > self.latest[0]]
+
+        for reading in readings:
+            if self.latest is None or reading[0] > self.latest[0]:
+                self.latest = reading
+            for subscription in self.subscribers:
+                subscription.push(reading)
+
+    async def _stop(self, registration):
+        try:
+            await stop_listening(registration)
+        except Exception as e:
+            logger.warning(f"Error closing a live listener of {self.product_id}: {str(e)}")
+
+    async def close(self):
+        self._closed = True
+        for timer in (self._rollover, self.idle_timer):
+            if timer is not None:
+                timer.cancel()
+        if self._registration is not None:
+            registration, self._registration = self._registration, None
+            live_listeners.dec()
+            await self._stop(registration)
+
+
+class LiveUsageHub:
+    """Shares one upstream listener per product between all clients streaming it."""
+
+    def __init__(self):
+        self._feeds: Dict[str, _ProductFeed] = {}
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, product_id: str) -> AsyncIterator[LiveSubscription]:
+        """Receive the new readings of a product while inside the block."""
+        feed = self._feeds.get(product_id)
+        if feed is None:
+            feed = self._feeds[product_id] = _ProductFeed(product_id)
+        if feed.idle_timer is not None:
+            feed.idle_timer.cancel()
+            feed.idle_timer = None
+
+        # Clients joining a running feed start from its newest reading; earlier ones get it when it arrives
+        subscription = LiveSubscription()
+        if feed.primed and feed.latest is not None:
+            subscription.push(feed.latest)
+        feed.subscribers.add(subscription)
+        live_subscribers.inc()
+        try:
+            await feed.start()
+            yield subscription
+        finally:
+            feed.subscribers.discard(subscription)
+            live_subscribers.dec()
+            if not feed.subscribers:
+                feed.idle_timer = asyncio.get_running_loop().call_later(
+                    LIVE_IDLE_SECONDS, self._close_if_idle, feed
+                )
+
+    def _close_if_idle(self, feed: _ProductFeed):
+        if feed.subscribers or self._feeds.get(feed.product_id) is not feed:
+            return
+        del self._feeds[feed.product_id]
+        asyncio.ensure_future(feed.close())
+
+    async def close(self):
+        """Close every upstream listener (at shutdown)."""
+        feeds, self._feeds = list(self._feeds.values()), {}
+        await asyncio.gather(*(feed.close() for feed in feeds), return_exceptions=True)
+
+
+live_hub = LiveUsageHub()
+
+
+class LiveService:
+    @staticmethod
+    async def stream_usage(product_id: str) -> AsyncIterator[str]:
+        """
+        Yield a product's readings as server-sent events: the newest known reading, then
+        every new one as it arrives, with a keepalive comment whenever the stream has
+        been quiet for LIVE_HEARTBEAT_SECONDS.
+        """
+        try:
+            async with live_hub.subscribe(product_id) as subscription:
+                while True:
+                    try:
+                        reading = await asyncio.wait_for(subscription.queue.get(), LIVE_HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield ": keepalive\n\n"
+                        continue
+                    yield _format_event(reading)
+        except Exception as e:
+            # The response has already started, so the stream can only be cut short
+            logger.error(f"Error streaming live usage for {product_id}: {str(e)}")
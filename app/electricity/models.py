@@ -1,5 +1,7 @@
+from datetime import datetime
+
 from pydantic import BaseModel
-from typing import List, Dict, Optional, Union
+from typing import List, Dict, Optional, Union, Literal
 
 class MinutelyUsageRequest(BaseModel):
     product_id: str
@@ -28,6 +30,10 @@ class ChartDataResponse(BaseModel):
     x_axis_label: str
     y_axis_label: str = "Power Consumption (W)"
 
+class RangeChartResponse(ChartDataResponse):
+    resolution: str  # minutely, hourly or daily: the data the points were computed from
+    source_points: int  # Points at that resolution before downsampling to the budget
+
 # New models for payment and billing
 class PaymentRecord(BaseModel):
     month: str  # YYYY-MM format
@@ -67,8 +73,42 @@ class UserProductStatus(BaseModel):
     email: Optional[str] = None
     connection_status: bool
     last_active: Optional[str] = None  # Will show the latest timestamp from data if available
+    error: Optional[str] = None  # Set when the device's status could not be fully retrieved
 
 class AllConnectionStatusResponse(BaseModel):
     timestamp: str  # Current UTC time when the request was made
     users: List[UserProductStatus]
-    total_count: int
\ No newline at end of file
+    total_count: int  # Users matching the filters, across all pages
+    next_cursor: Optional[str] = None  # Pass as cursor to get the next page; None on the last page
+
+class BillingRunResponse(BaseModel):
+    year_month: str  # YYYY-MM format
+    bills_generated: int
+    failed: List[str]  # Usernames whose bill could not be generated
+    duration_seconds: float
+
+class MeterReading(BaseModel):
+    product_id: str
+    timestamp: datetime  # UTC; seconds are dropped, one reading per minute
+    watts: float
+
+class ReadingBatchRequest(BaseModel):
+    readings: List[MeterReading]
+
+class ReadingBatchResponse(BaseModel):
+    accepted: int
+    rejected: int
+    products: int
+    writes: int  # Database round-trips used to store the batch
+    errors: List[str] = []
+
+class ChartQuery(BaseModel):
+    product_id: str
+    granularity: Literal["minutely", "hourly", "daily", "monthly"]
+    period: str  # "YYYY-MM-DD HH" (minutely), "YYYY-MM-DD" (hourly), "YYYY-MM" (daily) or "YYYY" (monthly)
+
+class BatchChartRequest(BaseModel):
+    queries: List[ChartQuery]
+
+class BatchChartResponse(BaseModel):
+    results: List[ChartDataResponse]  # In the order of the queries
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.config import ROLLUP_GRACE_SECONDS
+
+
+# Period strings used throughout the electricity module:
+#   "YYYY"           a year
+#   "YYYY-MM"        a month
+#   "YYYY-MM-DD"     a day
+#   "YYYY-MM-DD HH"  an hour
+
+def period_start(period: str) -> datetime:
+    """Return the first instant (UTC) of a period."""
+    if len(period) == 4:
+        return datetime.strptime(period, "%Y")
+    if len(period) == 7:
+        return datetime.strptime(period, "%Y-%m")
+    if len(period) == 10:
+        return datetime.strptime(period, "%Y-%m-%d")
+    if len(period) == 13:
+        return datetime.strptime(period, "%Y-%m-%d %H")
+    raise ValueError(f"Unrecognised period: {period}")
+
+
+def period_end(period: str) -> datetime:
+    """Return the first instant (UTC) after a period."""
+    start = period_start(period)
+    if len(period) == 4:
+        return start.replace(year=start.year + 1)
+    if len(period) == 7:
+        if start.month == 12:
+            return start.replace(year=start.year + 1, month=1)
+        return start.replace(month=start.month + 1)
+    if len(period) == 10:
+        return start + timedelta(days=1)
+    return start + timedelta(hours=1)
+
+
+def is_period_closed(period: str, now: Optional[datetime] = None) -> bool:
+    """Check whether a period has fully elapsed, so its data can no longer change."""
+    return (now or datetime.utcnow()) >= period_end(period)
+
+
+def settled_before(now: Optional[datetime] = None) -> datetime:
+    """
+    Periods that end at or before this instant are settled: devices write raw readings
+    straight to the database, and readings that arrive late (clock skew, retries,
+    offline buffering) are expected for ROLLUP_GRACE_SECONDS after a period ends.
+    """
+    return (now or datetime.utcnow()) - timedelta(seconds=ROLLUP_GRACE_SECONDS)
+
+
+def is_period_settled(period: str, now: Optional[datetime] = None) -> bool:
+    """Check whether a period is settled, so its rollups and results can be kept without expiry."""
+    return period_end(period) <= settled_before(now)
+
+
+def has_period_started(period: str, now: Optional[datetime] = None) -> bool:
+    """Check whether a period has begun, so it may hold data."""
+    return (now or datetime.utcnow()) >= period_start(period)
+
+
+def previous_month(now: Optional[datetime] = None) -> str:
+    """Return the month before the current one as "YYYY-MM"."""
+    first_day_of_current_month = (now or datetime.utcnow()).replace(day=1)
+    return (first_day_of_current_month - timedelta(days=1)).strftime("%Y-%m")
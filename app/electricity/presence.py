@@ -0,0 +1,285 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.logger import logger
+
+from app.config import FLEET_STATUS_CONCURRENCY, FLEET_STATUS_TIMEOUT_SECONDS, PRESENCE_TTL_SECONDS, \
+    PRESENCE_SWEEP_SECONDS, PRESENCE_USERS_REFRESH_SECONDS, PRESENCE_USERS_PAGE_SIZE
+from app.db.firebase import database
+from app.electricity.last_seen import LAST_SEEN_ROOT, format_last_seen, get_last_seen, parse_last_seen
+from app.electricity.models import UserProductStatus
+from app.electricity.status_buffer import connection_status_buffer
+
+
+# In-process presence of every device. A device is online while its last reported
+# status is true and it has been heard from (a status update, heartbeat or uploaded
+# readings) within PRESENCE_TTL_SECONDS. A sweep every PRESENCE_SWEEP_SECONDS turns
+# devices that went quiet offline, and the user directory is re-read every
+# PRESENCE_USERS_REFRESH_SECONDS to pick up new users. Each API process keeps its own
+# registry, loaded from the database on first use. Devices may report to any process:
+# each sweep reads the last-seen index and picks up the stored status of devices another
+# process heard from since, each directory refresh re-reads the stored presence of every
+# device, and an expiry is only written back to connection_status once the last-seen
+# index shows no process has heard from the device within PRESENCE_TTL_SECONDS either.
+
+
+class DevicePresence:
+    """What the registry knows about one device."""
+
+    __slots__ = ("status", "heard_at", "last_seen", "error")
+
+    def __init__(self, status: bool = False, heard_at: Optional[datetime] = None,
+                 last_seen: Optional[datetime] = None, error: Optional[str] = None):
+        self.status = status  # Last reported status
+        self.heard_at = heard_at  # When the device was last heard from
+        self.last_seen = last_seen  # Newest reading or status update, as in the last-seen index
+        self.error = error  # Why the stored status or last-seen time couldn't be read, until the device reports
+
+    def is_online(self, now: datetime) -> bool:
+        return self.status and self.heard_at is not None and \
+            now - self.heard_at <= timedelta(seconds=PRESENCE_TTL_SECONDS)
+
+    def adopt(self, stored: "DevicePresence"):
+        """
+        Take the stored presence where another process heard from the device after this one
+        did. The index keeps minutes, so changes within the minute of this process's own
+        update are kept as this process saw them.
+        """
+        if stored.last_seen is None:
+            return
+        if self.heard_at is None or stored.last_seen > self.heard_at:
+            self.status = stored.status
+            self.heard_at = stored.last_seen
+        if self.last_seen is None or stored.last_seen > self.last_seen:
+            self.last_seen = stored.last_seen
+
+
+class PresenceRegistry:
+    def __init__(self):
+        self._devices: Dict[str, DevicePresence] = {}
+        self._users: Dict[str, Tuple[str, str]] = {}  # username -> (product_id, email)
+        self._loading: Optional[asyncio.Future] = None
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def report(self, product_id: str, status: bool, now: datetime, last_seen: Optional[datetime] = None):
+        """Record that a device was heard from, with its status and (if not now) its newest reading time."""
+        device = self._devices.setdefault(product_id, DevicePresence())
+        device.status = status
+        device.heard_at = now
+        device.error = None
+        last_seen = last_seen or now
+        if device.last_seen is None or last_seen > device.last_seen:
+            device.last_seen = last_seen
+
+    def saw(self, product_id: str, last_seen: datetime):
+        """Record a reading time of a device that doesn't say it's online now (backfilled readings)."""
+        device = self._devices.get(product_id)
+        if device is not None and (device.last_seen is None or last_seen > device.last_seen):
+            device.last_seen = last_seen
+
+    async def ensure_loaded(self):
+        """Load the registry from the database once; concurrent callers wait for the same load."""
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load())
+        loading = self._loading
+        try:
+            await asyncio.shield(loading)
+        except Exception:
+            # Let the next caller try again
+            if self._loading is loading:
+                self._loading = None
+            raise
+
+    async def _load(self):
+        await self._refresh_users()
+        if self._sweeper is None:
+            self._sweeper = asyncio.ensure_future(self._sweep_periodically())
+
+    @staticmethod
+    async def _read_users() -> Dict[str, Tuple[str, str]]:
+        """
+        Read the user directory in pages of PRESENCE_USERS_PAGE_SIZE users, ordered by
+        username, so no single read has to download every user record.
+        """
+        page_size = max(PRESENCE_USERS_PAGE_SIZE, 2)
+        users = {}
+        start = None
+        while True:
+            page = await database.child("user_details").get_range(start=start, limit_to_first=page_size) or {}
+            for username, user_data in page.items():
+                if isinstance(user_data, dict) and user_data.get("product_id"):
+                    users[username] = (user_data["product_id"], user_data.get("email", ""))
+
+            if len(page) < page_size:
+                return users
+            # Range queries include their start, so the next page repeats this page's last user
+            start = max(page)
+
+    async def _refresh_users(self):
+        """
+        Re-read the user directory and the stored presence of every user's device, so
+        changes made through other processes reach this one.
+        """
+        users, last_seen_index = await asyncio.gather(
+            self._read_users(),
+            database.child(LAST_SEEN_ROOT).get()
+        )
+
+        products = sorted({product_id for product_id, _ in users.values()})
+        last_seen_index = last_seen_index if isinstance(last_seen_index, dict) else {}
+        stored = await self._read_devices(products, last_seen_index)
+
+        for product_id, found in zip(products, stored):
+            known = self._devices.get(product_id)
+            if known is None or known.error:
+                self._devices[product_id] = found
+            elif not found.error:
+                # Devices heard from while reading keep what this process heard
+                known.adopt(found)
+            # A known device whose stored presence can't be read keeps what this process knows
+
+        self._users = users
+
+    @staticmethod
+    async def _read_device(product_id: str, last_seen_entry: Optional[str] = None) -> DevicePresence:
+        """
+        The stored presence of a device: its connection status and its last-seen time, from
+        last_seen_entry if given, else from the index (rebuilt from raw data if missing).
+        Reads that fail or time out are reported in the error message and count as offline.
+        """
+        async def read_last_seen():
+            return last_seen_entry if last_seen_entry is not None else await get_last_seen(product_id)
+
+        status_result, last_seen_result = await asyncio.gather(
+            asyncio.wait_for(
+                database.child(f"electricity_usage/{product_id}/connection_status").get(),
+                FLEET_STATUS_TIMEOUT_SECONDS
+            ),
+            asyncio.wait_for(read_last_seen(), FLEET_STATUS_TIMEOUT_SECONDS),
+            return_exceptions=True
+        )
+
+        errors = []
+        status = False
+        if isinstance(status_result, asyncio.TimeoutError):
+            errors.append("Timed out reading connection status")
+        elif isinstance(status_result, Exception):
+            errors.append(f"Error reading connection status: {str(status_result)}")
+        else:
+            status = status_result is True
+
+        last_seen = None
+        if isinstance(last_seen_result, asyncio.TimeoutError):
+            errors.append("Timed out reading last active time")
+        elif isinstance(last_seen_result, Exception):
+            errors.append(f"Error reading last active time: {str(last_seen_result)}")
+        else:
+            last_seen = parse_last_seen(last_seen_result)
+
+        if errors:
+            logger.warning(f"Partial connection status for {product_id}: {'; '.join(errors)}")
+        return DevicePresence(status, last_seen, last_seen, "; ".join(errors) if errors else None)
+
+    @staticmethod
+    async def _read_devices(product_ids: List[str], last_seen_index: Dict[str, str]) -> List[DevicePresence]:
+        """The stored presence of each product, with a bounded number of reads in flight."""
+        semaphore = asyncio.Semaphore(FLEET_STATUS_CONCURRENCY)
+
+        async def read_device(product_id: str) -> DevicePresence:
+            async with semaphore:
+                return await PresenceRegistry._read_device(product_id, last_seen_index.get(product_id))
+
+        return list(await asyncio.gather(*(read_device(product_id) for product_id in product_ids)))
+
+    async def sweep(self, now: Optional[datetime] = None) -> int:
+        """
+        Pick up devices heard from by other processes and turn devices that went quiet
+        offline. Returns how many expired.
+
+        The last-seen index is read in one go; devices whose entry moved past what this
+        process knows have their stored status read. Before an expiry is written, the
+        stored presence is read back too: a device that another process heard from within
+        PRESENCE_TTL_SECONDS takes the stored status instead, and devices whose presence
+        can't be read are tried again at the next sweep.
+        """
+        now = now or datetime.utcnow()
+        last_seen_index = await database.child(LAST_SEEN_ROOT).get()
+        last_seen_index = last_seen_index if isinstance(last_seen_index, dict) else {}
+
+        changed = []
+        expiring = []
+        for product_id, device in self._devices.items():
+            if device.status and not device.is_online(now):
+                expiring.append(product_id)
+                continue
+            entry = parse_last_seen(last_seen_index.get(product_id))
+            if entry is not None and (device.last_seen is None or entry > device.last_seen):
+                changed.append(product_id)
+
+        stored = await self._read_devices(changed + expiring, last_seen_index)
+
+        for product_id, found in zip(changed, stored):
+            if not found.error:
+                self._devices[product_id].adopt(found)
+
+        expired = 0
+        for product_id, found in zip(expiring, stored[len(changed):]):
+            device = self._devices[product_id]
+            if device.is_online(now) or found.error:
+                # Heard from while reading, or the stored presence is unknown
+                continue
+
+            if found.last_seen is not None and now - found.last_seen <= timedelta(seconds=PRESENCE_TTL_SECONDS):
+                # Another process heard from the device
+                device.adopt(found)
+                continue
+
+            device.status = False
+            expired += 1
+            if found.status:
+                await connection_status_buffer.record(product_id, False, None)
+        return expired
+
+    async def _sweep_periodically(self):
+        last_refresh = datetime.utcnow()
+        while True:
+            await asyncio.sleep(PRESENCE_SWEEP_SECONDS)
+            try:
+                expired = await self.sweep()
+                if expired:
+                    logger.info(f"Marked {expired} devices offline after {PRESENCE_TTL_SECONDS}s without contact")
+
+                if datetime.utcnow() - last_refresh >= timedelta(seconds=PRESENCE_USERS_REFRESH_SECONDS):
+                    last_refresh = datetime.utcnow()
+                    await self._refresh_users()
+            except Exception as e:
+                logger.error(f"Error sweeping device presence: {str(e)}")
+
+    def user_statuses(self, now: datetime) -> List[UserProductStatus]:
+        """The presence of every user's device, from memory."""
+        statuses = []
+        for username, (product_id, email) in self._users.items():
+            device = self._devices.get(product_id) or DevicePresence()
+            statuses.append(UserProductStatus(
+                username=username,
+                product_id=product_id,
+                email=email,
+                connection_status=device.is_online(now),
+                last_active=format_last_seen(device.last_seen) if device.last_seen else None,
+                error=device.error
+            ))
+        return statuses
+
+    async def close(self):
+        """Stop loading and the sweeper, after queueing the last expirations (at shutdown)."""
+        if self._loading is not None and not self._loading.done():
+            self._loading.cancel()
+        if self._sweeper is None:
+            return
+        self._sweeper.cancel()
+        self._sweeper = None
+        await self.sweep()
+
+
+presence_registry = PresenceRegistry()
@@ -0,0 +1,236 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+import numpy as np
+from fastapi.logger import logger
+
+from app.config import RANGE_MAX_DAYS, RANGE_MAX_POINTS, RANGE_MAX_RAW_DAYS, RESULT_CACHE_OPEN_PERIOD_TTL_SECONDS
+from app.core.cache import result_cache
+from app.core.exceptions import BadRequestError
+from app.db.firebase import database
+from app.electricity.models import ChartDataPoint, RangeChartResponse
+from app.electricity.periods import has_period_started, settled_before
+from app.electricity.rollups import RollupService
+from app.electricity.timeseries import MINUTES_PER_DAY, MonthSeries
+
+
+# Smallest point budget a chart can ask for: LTTB always keeps the first and last point
+MIN_POINTS = 3
+
+# Label format of the points at each resolution
+LABEL_FORMATS = {
+    "minutely": "%Y-%m-%dT%H:%M",
+    "hourly": "%Y-%m-%dT%H:00",
+    "daily": "%Y-%m-%d",
+}
+
+# Ranges are arbitrary, so their cached charts can't be looked up to be dropped when
+# readings arrive. Instead each product's cache keys carry a generation that ingestion
+# bumps, and the charts of earlier generations age out of the cache.
+_generations: Dict[str, int] = {}
+
+
+def _to_utc(timestamp: datetime) -> datetime:
+    """Normalise a timestamp to a naive UTC datetime."""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _dates(start: datetime, end: datetime) -> List[str]:
+    """Every date the half-open range [start, end) touches, as "YYYY-MM-DD"."""
+    last = (end - timedelta(minutes=1)).date()
+    day = start.date()
+    dates = []
+    while day <= last:
+        dates.append(day.strftime("%Y-%m-%d"))
+        day += timedelta(days=1)
+    return dates
+
+
+def _months(dates: List[str]) -> List[str]:
+    """The months holding the given dates that have started, as "YYYY-MM"."""
+    return [year_month for year_month in dict.fromkeys(date[:7] for date in dates) if has_period_started(year_month)]
+
+
+def choose_resolution(start: datetime, end: datetime, max_points: int) -> str:
+    """
+    The coarsest resolution that still gives the chart at least max_points points over
+    the range, so no more data is read than the chart can show. Raw minutes are only
+    read for ranges up to RANGE_MAX_RAW_DAYS days; longer ranges use hourly rollups.
+    """
+    span = end - start
+    if span / timedelta(days=1) >= max_points:
+        return "daily"
+    if span / timedelta(hours=1) >= max_points or span > timedelta(days=RANGE_MAX_RAW_DAYS):
+        return "hourly"
+    return "minutely"
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets downsampling.
+
+    The first and last points are always kept; every bucket in between keeps the point
+    forming the largest triangle with the point kept before it and the average of the
+    next bucket, which preserves peaks and the overall shape of the series.
+    """
+    length = len(x)
+    if threshold >= length or threshold < MIN_POINTS:
+        return np.arange(length)
+
+    every = (length - 2) / (threshold - 2)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0] = previous = 0
+
+    for bucket in range(threshold - 2):
+        # Average of the next bucket (the last point for the final bucket)
+        next_start = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, length)
+        average_x = x[next_start:next_end].mean()
+        average_y = y[next_start:next_end].mean()
+
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        areas = np.abs(
+            (x[previous] - average_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (average_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        kept[bucket + 1] = previous
+
+    kept[-1] = length - 1
+    return kept
+
+
+class RangeService:
+    @staticmethod
+    def invalidate(product_id: str):
+        """Stop serving the cached range charts of a product, whose readings changed."""
+        _generations[product_id] = _generations.get(product_id, 0) + 1
+
+    @staticmethod
+    def validate(start: datetime, end: datetime, max_points: int) -> Tuple[datetime, datetime]:
+        """Check a range request and return its bounds as naive UTC datetimes."""
+        start, end = _to_utc(start), _to_utc(end)
+        if end <= start:
+            raise BadRequestError("end must be after start")
+        if end - start > timedelta(days=RANGE_MAX_DAYS):
+            raise BadRequestError(f"A range can cover at most {RANGE_MAX_DAYS} days")
+        if not MIN_POINTS <= max_points <= RANGE_MAX_POINTS:
+            raise BadRequestError(f"max_points must be between {MIN_POINTS} and {RANGE_MAX_POINTS}")
+        return start, end
+
+    @staticmethod
+    async def _minute_points(product_id: str, start: datetime, end: datetime) -> Tuple[List[datetime], np.ndarray]:
+        """Raw minute readings in the range, read with a single range query."""
+        dates = _dates(start, end)
+        payload = await database.child(f"electricity_usage/{product_id}").get_range(dates[0], dates[-1]) or {}
+        series = MonthSeries.from_payload(dates, payload)
+        del payload
+
+        first_minute = datetime.strptime(dates[0], "%Y-%m-%d")
+        offsets = np.arange(len(dates) * MINUTES_PER_DAY)
+        low = int((start - first_minute) / timedelta(minutes=1))
+        high = int(-(-(end - first_minute) // timedelta(minutes=1)))
+        in_range = series.valid.reshape(-1) & (offsets >= low) & (offsets < high)
+
+        minutes = np.flatnonzero(in_range)
+        times = [first_minute + timedelta(minutes=int(minute)) for minute in minutes]
+        return times, series.values.reshape(-1)[minutes].astype(np.float64)
+
+    @staticmethod
+    async def _hour_points(product_id: str, start: datetime, end: datetime) -> Tuple[List[datetime], np.ndarray]:
+        """Hourly rollup averages for the hours starting in the range, one rollup read per month."""
+        first_hour = start.replace(minute=0, second=0, microsecond=0)
+        months = _months(_dates(start, end))
+        results = await asyncio.gather(
+            *(RollupService.get_month_buckets(product_id, year_month, with_hourly=True) for year_month in months)
+        )
+
+        points = []
+        for _, hourly in results:
+            for date_str, hour_buckets in hourly.items():
+                day_start = datetime.strptime(date_str, "%Y-%m-%d")
+                for hour, bucket in hour_buckets.items():
+                    timestamp = day_start + timedelta(hours=int(hour))
+                    if bucket.count and first_hour <= timestamp < end:
+                        points.append((timestamp, bucket.mean))
+
+        points.sort()
+        return [timestamp for timestamp, _ in points], np.array([value for _, value in points], dtype=np.float64)
+
+    @staticmethod
+    async def _day_points(product_id: str, start: datetime, end: datetime) -> Tuple[List[datetime], np.ndarray]:
+        """Daily rollup averages for the days in the range, one rollup read per month."""
+        first_day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        months = _months(_dates(start, end))
+        results = await asyncio.gather(
+            *(RollupService.get_month_buckets(product_id, year_month) for year_month in months)
+        )
+
+        points = []
+        for year_month, (daily, _) in zip(months, results):
+            for day, bucket in daily.items():
+                timestamp = datetime.strptime(f"{year_month}-{day}", "%Y-%m-%d")
+                if first_day <= timestamp < end:
+                    points.append((timestamp, bucket.mean))
+
+        points.sort()
+        return [timestamp for timestamp, _ in points], np.array([value for _, value in points], dtype=np.float64)
+
+    @staticmethod
+    async def get_range_usage(product_id: str, start: datetime, end: datetime,
+                              max_points: int) -> RangeChartResponse:
+        """
+        Get average electricity usage over an arbitrary time range as at most max_points points.
+
+        The data is read at the coarsest resolution that still fills the point budget
+        (raw minutes, hourly or daily rollups) and downsampled to the budget with LTTB.
+        """
+        cache_key = (product_id, "range", _generations.get(product_id, 0), start, end, max_points)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        resolution = choose_resolution(start, end, max_points)
+        title = f"Usage from {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}"
+        x_axis_label = "Date" if resolution == "daily" else "Time"
+        try:
+            if resolution == "minutely":
+                times, values = await RangeService._minute_points(product_id, start, end)
+            elif resolution == "hourly":
+                times, values = await RangeService._hour_points(product_id, start, end)
+            else:
+                times, values = await RangeService._day_points(product_id, start, end)
+
+            # Downsample on minutes since the start of the range, so gaps in the data keep their width
+            offsets = np.array([(timestamp - start) / timedelta(minutes=1) for timestamp in times], dtype=np.float64)
+            kept = lttb(offsets, values, max_points)
+
+            label_format = LABEL_FORMATS[resolution]
+            data_points = [
+                ChartDataPoint(label=times[index].strftime(label_format), value=round(float(values[index]), 2))
+                for index in kept
+            ]
+
+            result = RangeChartResponse(
+                data_points=data_points,
+                chart_title=title,
+                x_axis_label=x_axis_label,
+                resolution=resolution,
+                source_points=len(times)
+            )
+            settled = end <= settled_before()
+            result_cache.set(cache_key, result, ttl=None if settled else RESULT_CACHE_OPEN_PERIOD_TTL_SECONDS)
+            return result
+        except Exception as e:
+            logger.error(f"Error retrieving range data for {product_id}: {str(e)}")
+            return RangeChartResponse(
+                data_points=[],
+                chart_title=f"No data available from {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}",
+                x_axis_label=x_axis_label,
+                resolution=resolution,
+                source_points=0
+            )
@@ -0,0 +1,345 @@
+import asyncio
+import calendar
+import contextlib
+import contextvars
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from fastapi.logger import logger
+
+from app.db.firebase import database
+from app.electricity.aggregation import BucketStats
+from app.electricity.periods import is_period_settled, has_period_started
+from app.electricity.timeseries import DaySeries, MonthSeries
+
+
+# Rollups live next to the raw minute data in their own tree:
+#   electricity_rollups/{product_id}/hourly/{YYYY-MM-DD}/{HH}
+#   electricity_rollups/{product_id}/daily/{YYYY-MM}/{DD}
+#   electricity_rollups/{product_id}/monthly/{YYYY}/{MM}
+# Each bucket stores the sum, count, min and max of the minute readings in it.
+ROLLUPS_ROOT = "electricity_rollups"
+
+# Rollup writes collected inside batched_rollup_writes(): path -> value of one multi-path update
+_pending_writes = contextvars.ContextVar("pending_rollup_writes", default=None)
+
+
+@contextlib.asynccontextmanager
+async def batched_rollup_writes():
+    """
+    Collect the rollups stored by everything running inside this block, including by
+    tasks it spawns, and write them in one multi-path update at the end. Queries that
+    roll up the same day store it once, and no write lands in the middle of the block
+    to drop the reads shared there. Rollups are derived from raw data, so a failed
+    write is logged and the rollups are computed again next time.
+    """
+    token = _pending_writes.set({})
+    try:
+        yield
+    finally:
+        updates = _pending_writes.get()
+        _pending_writes.reset(token)
+    if updates:
+        try:
+            await database.update(updates)
+        except Exception as e:
+            logger.error(f"Error storing {len(updates)} batched rollups: {str(e)}")
+
+
+class UsageBucket:
+    """Running (sum, count, min, max) of the minute readings in one period."""
+
+    __slots__ = ("sum", "count", "min", "max")
+
+    def __init__(self, sum: float = 0.0, count: int = 0, min: Optional[float] = None, max: Optional[float] = None):
+        self.sum = sum
+        self.count = count
+        self.min = min
+        self.max = max
+
+    def add(self, value: float):
+        """Add a single reading to the bucket."""
+        self.sum += value
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "UsageBucket"):
+        """Fold another bucket into this one."""
+        if not other.count:
+            return
+        self.sum += other.sum
+        self.count += other.count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def to_dict(self) -> dict:
+        data = {"sum": self.sum, "count": self.count}
+        if self.count:
+            data["min"] = self.min
+            data["max"] = self.max
+        return data
+
+    @classmethod
+    def from_dict(cls, data) -> "UsageBucket":
+        if not isinstance(data, dict):
+            return cls()
+        try:
+            return cls(
+                sum=float(data.get("sum", 0.0)),
+                count=int(data.get("count", 0)),
+                min=float(data["min"]) if data.get("min") is not None else None,
+                max=float(data["max"]) if data.get("max") is not None else None
+            )
+        except (ValueError, TypeError):
+            return cls()
+
+
+def _as_mapping(node) -> dict:
+    """Firebase turns objects with numeric keys into lists; turn them back into a key -> value mapping."""
+    if isinstance(node, dict):
+        return node
+    if isinstance(node, list):
+        return {f"{index:02d}": value for index, value in enumerate(node) if value is not None}
+    return {}
+
+
+def _read_buckets(node) -> Dict[str, UsageBucket]:
+    return {key: UsageBucket.from_dict(value) for key, value in _as_mapping(node).items()}
+
+
+def _stats_bucket(stats: BucketStats, index) -> UsageBucket:
+    """Build a bucket from one entry of vectorized bucket statistics."""
+    count = int(stats.count[index])
+    if not count:
+        return UsageBucket()
+    return UsageBucket(
+        sum=float(stats.sum[index]),
+        count=count,
+        min=float(stats.min[index]),
+        max=float(stats.max[index])
+    )
+
+
+def _hour_buckets_from_stats(stats: BucketStats, day_index=None) -> Dict[str, UsageBucket]:
+    buckets = {}
+    counts = stats.count if day_index is None else stats.count[day_index]
+    for hour in np.flatnonzero(counts):
+        index = hour if day_index is None else (day_index, hour)
+        buckets[f"{hour:02d}"] = _stats_bucket(stats, index)
+    return buckets
+
+
+def day_hour_buckets(series: DaySeries) -> Dict[str, UsageBucket]:
+    """Build the hourly buckets of one day of minute readings."""
+    return _hour_buckets_from_stats(series.hourly_stats())
+
+
+def month_hour_buckets(series: MonthSeries) -> List[Dict[str, UsageBucket]]:
+    """Build the hourly buckets of every day in a month series in one vectorized pass."""
+    stats = series.hourly_stats()
+    return [_hour_buckets_from_stats(stats, day_index) for day_index in range(len(series.dates))]
+
+
+def merge_buckets(buckets: Iterable[UsageBucket]) -> UsageBucket:
+    total = UsageBucket()
+    for bucket in buckets:
+        total.merge(bucket)
+    return total
+
+
+class RollupService:
+    @staticmethod
+    def _rollup_path(product_id: str, level: str, *parts: str) -> str:
+        return "/".join((ROLLUPS_ROOT, product_id, level) + parts)
+
+    @staticmethod
+    async def _store(updates: dict):
+        """Write rollups now, or with the rest of the batch inside batched_rollup_writes()."""
+        pending = _pending_writes.get()
+        if pending is None:
+            await database.update(updates)
+        else:
+            pending.update(updates)
+
+    @staticmethod
+    def _pending_hour_buckets(product_id: str, date_str: str) -> Optional[Dict[str, UsageBucket]]:
+        """The hourly buckets of a day already rolled up in this batch, if any."""
+        pending = _pending_writes.get()
+        year_month, day = date_str[:7], date_str[8:]
+        if not pending or RollupService._rollup_path(product_id, "daily", year_month, day) not in pending:
+            return None
+        buckets = {}
+        for hour in range(24):
+            node = pending.get(RollupService._rollup_path(product_id, "hourly", date_str, f"{hour:02d}"))
+            if node is not None:
+                buckets[f"{hour:02d}"] = UsageBucket.from_dict(node)
+        return buckets
+
+    @staticmethod
+    async def get_hour_buckets(product_id: str, date_str: str) -> Dict[str, UsageBucket]:
+        """Get the hourly buckets for a day, rolling them up from raw data if they are missing."""
+        buckets = RollupService._pending_hour_buckets(product_id, date_str)
+        if buckets is not None:
+            return buckets
+
+        node = await database.child(RollupService._rollup_path(product_id, "hourly", date_str)).get()
+        if node:
+            return _read_buckets(node)
+
+        # Fall back to the raw minute data for the day
+        day_data = await database.child(f"electricity_usage/{product_id}/{date_str}").get() or {}
+        buckets = day_hour_buckets(DaySeries.from_payload(date_str, day_data))
+
+        # Only persist days that are no longer expected to receive readings
+        if is_period_settled(date_str):
+            await RollupService._store(RollupService._day_updates(product_id, date_str, buckets))
+
+        return buckets
+
+    @staticmethod
+    async def get_month_buckets(product_id: str, year_month: str,
+                                with_hourly: bool = False) -> Tuple[Dict[str, UsageBucket], Dict[str, Dict[str, UsageBucket]]]:
+        """
+        Get the daily buckets for a month, rolling up any missing days from raw data.
+
+        When with_hourly is set, the hourly buckets of every day in the month are returned as well,
+        keyed by date.
+        """
+        year, month = year_month.split('-')
+        _, days_in_month = calendar.monthrange(int(year), int(month))
+
+        daily = _read_buckets(await database.child(RollupService._rollup_path(product_id, "daily", year_month)).get())
+
+        # Days that have started but have no rollup yet must come from raw data
+        missing = [
+            f"{day:02d}" for day in range(1, days_in_month + 1)
+            if f"{day:02d}" not in daily and has_period_started(f"{year_month}-{day:02d}")
+        ]
+
+        computed_hourly = {}
+        if missing:
+            raw_data = await database.child(f"electricity_usage/{product_id}").get_range(
+                f"{year_month}-{missing[0]}",
+                f"{year_month}-{missing[-1]}"
+            ) or {}
+
+            # Convert the raw payload to a compact series once, then compute every day's hourly buckets together
+            series = MonthSeries.from_payload([f"{year_month}-{day}" for day in missing], raw_data)
+            del raw_data
+            missing_hour_buckets = month_hour_buckets(series)
+
+            updates = {}
+            for day, hour_buckets in zip(missing, missing_hour_buckets):
+                date_str = f"{year_month}-{day}"
+                daily[day] = merge_buckets(hour_buckets.values())
+                computed_hourly[date_str] = hour_buckets
+
+                if is_period_settled(date_str):
+                    updates.update(RollupService._day_updates(product_id, date_str, hour_buckets))
+
+            if updates:
+                await RollupService._store(updates)
+
+        hourly = {}
+        if with_hourly:
+            hourly_data = await database.child(RollupService._rollup_path(product_id, "hourly")).get_range(
+                f"{year_month}-01",
+                f"{year_month}-{days_in_month:02d}"
+            ) or {}
+            hourly = {date_str: _read_buckets(node) for date_str, node in hourly_data.items()}
+            hourly.update(computed_hourly)
+
+        return {day: bucket for day, bucket in daily.items() if bucket.count}, hourly
+
+    @staticmethod
+    async def get_year_buckets(product_id: str, year: str) -> Dict[str, UsageBucket]:
+        """
+        Get the monthly buckets for a year, rolling up any missing months from the daily rollups.
+
+        Raises if any month can't be read, rather than returning a year with months missing;
+        the months that did roll up are still stored.
+        """
+        monthly = _read_buckets(await database.child(RollupService._rollup_path(product_id, "monthly", year)).get())
+
+        # Months that need recomputing; only settled months are trusted from the store
+        pending = []
+        for month in range(1, 13):
+            month_str = f"{month:02d}"
+            year_month = f"{year}-{month_str}"
+
+            if month_str in monthly and is_period_settled(year_month):
+                continue
+            monthly.pop(month_str, None)
+            if has_period_started(year_month):
+                pending.append(month_str)
+
+        # Roll up the pending months concurrently from their daily buckets
+        results = await asyncio.gather(
+            *(RollupService.get_month_buckets(product_id, f"{year}-{month_str}") for month_str in pending),
+            return_exceptions=True
+        )
+
+        updates = {}
+        failure = None
+        for month_str, result in zip(pending, results):
+            year_month = f"{year}-{month_str}"
+            if isinstance(result, Exception):
+                logger.warning(f"Error rolling up month {year_month} for {product_id}: {str(result)}")
+                failure = failure or result
+                continue
+
+            daily, _ = result
+            monthly[month_str] = merge_buckets(daily.values())
+            if is_period_settled(year_month):
+                updates[RollupService._rollup_path(product_id, "monthly", year, month_str)] = \
+                    monthly[month_str].to_dict()
+
+        if updates:
+            await RollupService._store(updates)
+        if failure is not None:
+            raise failure
+
+        return {month: bucket for month, bucket in monthly.items() if bucket.count}
+
+    @staticmethod
+    def _day_updates(product_id: str, date_str: str, hour_buckets: Dict[str, UsageBucket]) -> dict:
+        """Multi-path update that stores a day's hourly buckets and its daily bucket."""
+        year_month, day = date_str[:7], date_str[8:]
+        updates = {
+            RollupService._rollup_path(product_id, "hourly", date_str, hour): bucket.to_dict()
+            for hour, bucket in hour_buckets.items()
+        }
+        # The daily bucket is written even when empty so the day isn't rolled up again
+        updates[RollupService._rollup_path(product_id, "daily", year_month, day)] = \
+            merge_buckets(hour_buckets.values()).to_dict()
+        return updates
+
+    @staticmethod
+    def build_rollup_updates(product_id: str, timestamps: Iterable[datetime]) -> dict:
+        """
+        Drop the rollups of the periods new minute readings fall in.
+
+        Returns a multi-path update for callers to write together with the raw readings.
+        The hourly and daily buckets of every affected day and the monthly buckets of the
+        affected months are removed, to be rolled up again from raw data (and the daily
+        buckets) when next read. Rebuilding them here instead would race with other
+        batches for the same day, each working from a raw snapshot missing the other's
+        readings.
+        """
+        dates = {timestamp.strftime("%Y-%m-%d") for timestamp in timestamps}
+
+        updates = {}
+        for date_str in dates:
+            updates[RollupService._rollup_path(product_id, "hourly", date_str)] = None
+            updates[RollupService._rollup_path(product_id, "daily", date_str[:7], date_str[8:])] = None
+
+        for year_month in {date_str[:7] for date_str in dates}:
+            updates[RollupService._rollup_path(product_id, "monthly", year_month[:4], year_month[5:])] = None
+
+        return updates
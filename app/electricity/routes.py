@@ -1,4 +1,11 @@
-from fastapi import APIRouter, HTTPException, status
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+
+from app.core.http_cache import conditional_response
+from app.core.security import require_admin_token
 
 from app.electricity.models import (
     MinutelyUsageRequest,
@@ -6,13 +13,33 @@ from app.electricity.models import (
     DailyUsageRequest,
     MonthlyUsageRequest,
     ChartDataResponse, BillResponse, PaymentHistoryResponse, ConnectionStatusResponse, ConnectionStatusRequest,
-    AllConnectionStatusResponse
+    AllConnectionStatusResponse, BillingRunResponse, ReadingBatchRequest, ReadingBatchResponse,
+    BatchChartRequest, BatchChartResponse, RangeChartResponse
 )
+from app.electricity.billing import BillingService
+from app.electricity.export import ExportService, EXPORT_FORMATS
+from app.electricity.fleet import FleetStatusService
+from app.electricity.ingestion import IngestionService
+from app.electricity.live import LiveService
+from app.electricity.periods import is_period_settled, settled_before
+from app.electricity.ranges import RangeService
 from app.electricity.service import ElectricityUsageService
 
 router = APIRouter()
 
 
+def _chart_response(request: Request, chart: ChartDataResponse, period: str) -> Response:
+    """
+    Send a chart with an ETag and Cache-Control, or a 304 if the client's copy is current.
+    Empty charts may come from a failed read, so only charts with data are cached long.
+    """
+    try:
+        closed = bool(chart.data_points) and is_period_settled(period)
+    except ValueError:
+        closed = False
+    return conditional_response(request, chart, closed)
+
+
 @router.post("/minutely", response_model=ChartDataResponse)
 async def get_minutely_usage(request: MinutelyUsageRequest):
     """
@@ -24,7 +51,7 @@ async def get_minutely_usage(request: MinutelyUsageRequest):
 
     This endpoint is publicly accessible.
     """
-    return ElectricityUsageService.get_minutely_usage(
+    return await ElectricityUsageService.get_minutely_usage(
         request.product_id,
         request.date,
         request.hour
@@ -42,7 +69,7 @@ async def get_hourly_usage(request: HourlyUsageRequest):
 
     This endpoint is publicly accessible.
     """
-    return ElectricityUsageService.get_hourly_usage(
+    return await ElectricityUsageService.get_hourly_usage(
         request.product_id,
         request.date
     )
@@ -59,7 +86,7 @@ async def get_daily_usage(request: DailyUsageRequest):
 
     This endpoint is publicly accessible.
     """
-    return ElectricityUsageService.get_daily_usage(
+    return await ElectricityUsageService.get_daily_usage(
         request.product_id,
         request.year_month
     )
@@ -76,15 +103,31 @@ async def get_monthly_usage(request: MonthlyUsageRequest):
 
     This endpoint is publicly accessible.
     """
-    return ElectricityUsageService.get_monthly_usage(
+    return await ElectricityUsageService.get_monthly_usage(
         request.product_id,
         request.year
     )
 
 
+@router.post("/batch", response_model=BatchChartResponse)
+async def get_chart_batch(request: BatchChartRequest):
+    """
+    Get several charts in one request.
+
+    - queries: List of {product_id, granularity, period}, where granularity is
+      minutely ("YYYY-MM-DD HH"), hourly ("YYYY-MM-DD"), daily ("YYYY-MM") or monthly ("YYYY")
+
+    Queries run concurrently and share identical database reads. Charts are returned
+    in the order of the queries.
+
+    This endpoint is publicly accessible.
+    """
+    return await ElectricityUsageService.get_chart_batch(request.queries)
+
+
 # Add GET endpoints for more flexibility
 @router.get("/minutely/{product_id}/{date}/{hour}", response_model=ChartDataResponse)
-async def get_minutely_usage_get(product_id: str, date: str, hour: str):
+async def get_minutely_usage_get(request: Request, product_id: str, date: str, hour: str):
     """
     Get minute-by-minute electricity usage for a specific hour in a day using GET.
 
@@ -96,13 +139,17 @@ async def get_minutely_usage_get(product_id: str, date: str, hour: str):
     - X-axis shows minutes (00-59)
     - Y-axis shows average watt values
 
+    Send the ETag back in If-None-Match to get a 304 when the chart hasn't changed;
+    charts of settled periods may be cached by clients and CDNs.
+
     This endpoint is publicly accessible.
     """
-    return ElectricityUsageService.get_minutely_usage(product_id, date, hour)
+    chart = await ElectricityUsageService.get_minutely_usage(product_id, date, hour)
+    return _chart_response(request, chart, f"{date} {hour}")
 
 
 @router.get("/hourly/{product_id}/{date}", response_model=ChartDataResponse)
-async def get_hourly_usage_get(product_id: str, date: str):
+async def get_hourly_usage_get(request: Request, product_id: str, date: str):
     """
     Get hourly electricity usage for a specific day using GET.
 
@@ -113,13 +160,17 @@ async def get_hourly_usage_get(product_id: str, date: str):
     - X-axis shows hours (00-23)
     - Y-axis shows average watt values
 
+    Send the ETag back in If-None-Match to get a 304 when the chart hasn't changed;
+    charts of settled periods may be cached by clients and CDNs.
+
     This endpoint is publicly accessible.
     """
-    return ElectricityUsageService.get_hourly_usage(product_id, date)
+    chart = await ElectricityUsageService.get_hourly_usage(product_id, date)
+    return _chart_response(request, chart, date)
 
 
 @router.get("/daily/{product_id}/{year_month}", response_model=ChartDataResponse)
-async def get_daily_usage_get(product_id: str, year_month: str):
+async def get_daily_usage_get(request: Request, product_id: str, year_month: str):
     """
     Get daily electricity usage for a specific month using GET.
 
@@ -130,13 +181,17 @@ async def get_daily_usage_get(product_id: str, year_month: str):
     - X-axis shows days (01-31)
     - Y-axis shows average watt values
 
+    Send the ETag back in If-None-Match to get a 304 when the chart hasn't changed;
+    charts of settled periods may be cached by clients and CDNs.
+
     This endpoint is publicly accessible.
     """
-    return ElectricityUsageService.get_daily_usage(product_id, year_month)
+    chart = await ElectricityUsageService.get_daily_usage(product_id, year_month)
+    return _chart_response(request, chart, year_month)
 
 
 @router.get("/monthly/{product_id}/{year}", response_model=ChartDataResponse)
-async def get_monthly_usage_get(product_id: str, year: str):
+async def get_monthly_usage_get(request: Request, product_id: str, year: str):
     """
     Get monthly electricity usage for a specific year using GET.
 
@@ -147,9 +202,80 @@ async def get_monthly_usage_get(product_id: str, year: str):
     - X-axis shows months (01-12)
     - Y-axis shows average watt values
 
+    Send the ETag back in If-None-Match to get a 304 when the chart hasn't changed;
+    charts of settled periods may be cached by clients and CDNs.
+
+    This endpoint is publicly accessible.
+    """
+    chart = await ElectricityUsageService.get_monthly_usage(product_id, year)
+    return _chart_response(request, chart, year)
+
+
+@router.get("/range/{product_id}", response_model=RangeChartResponse)
+async def get_range_usage(request: Request, product_id: str, start: datetime, end: datetime,
+                          max_points: int = 500):
+    """
+    Get electricity usage over an arbitrary time range, for zoomable charts.
+
+    - product_id: The product identifier
+    - start: Start of the range, an ISO 8601 date or timestamp (UTC unless it has an offset)
+    - end: End of the range (exclusive)
+    - max_points: Most points to return (default 500)
+
+    The data is read at the coarsest resolution that still fills max_points (raw minutes,
+    hourly or daily rollups) and downsampled to max_points, keeping peaks and the overall
+    shape. The resolution used is returned in the response.
+
+    Send the ETag back in If-None-Match to get a 304 when the chart hasn't changed;
+    charts of settled periods may be cached by clients and CDNs.
+
+    This endpoint is publicly accessible.
+    """
+    start, end = RangeService.validate(start, end, max_points)
+    chart = await RangeService.get_range_usage(product_id, start, end, max_points)
+    return conditional_response(request, chart, bool(chart.data_points) and end <= settled_before())
+
+
+@router.get("/export/{product_id}")
+async def export_readings(product_id: str, start: str, end: str, format: str = "ndjson"):
+    """
+    Stream the raw minute readings of a product over a date range.
+
+    - product_id: The product identifier
+    - start: First date in YYYY-MM-DD format
+    - end: Last date in YYYY-MM-DD format (inclusive)
+    - format: "ndjson" (default) or "csv"
+
+    Rows are sent as each day is decoded, so large ranges start arriving immediately.
+
+    This endpoint is publicly accessible.
+    """
+    dates = ExportService.validate(start, end, format)
+    return StreamingResponse(
+        ExportService.stream_readings(product_id, dates, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{product_id}_{start}_{end}.{format}"'}
+    )
+
+
+@router.get("/live/{product_id}")
+async def stream_live_usage(product_id: str):
+    """
+    Stream a product's minute readings as they arrive, as server-sent events.
+
+    - product_id: The product identifier
+
+    Sends the newest reading first, then an "event: reading" with
+    {"timestamp", "watts"} for every new one. Quiet streams get a keepalive comment
+    every LIVE_HEARTBEAT_SECONDS. All clients of a product share one database listener.
+
     This endpoint is publicly accessible.
     """
-    return ElectricityUsageService.get_monthly_usage(product_id, year)
+    return StreamingResponse(
+        LiveService.stream_usage(product_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.get("/payments/{username}", response_model=PaymentHistoryResponse)
@@ -163,7 +289,7 @@ async def get_payment_history(username: str):
 
     This endpoint is publicly accessible.
     """
-    return ElectricityUsageService.get_payment_history(username)
+    return await ElectricityUsageService.get_payment_history(username)
 
 
 @router.get("/bill/{username}", response_model=BillResponse)
@@ -178,7 +304,35 @@ async def generate_bill(username: str):
 
     This endpoint is publicly accessible.
     """
-    return ElectricityUsageService.generate_bill(username)
+    return await ElectricityUsageService.generate_bill(username)
+
+
+@router.post("/readings", response_model=ReadingBatchResponse)
+async def ingest_readings(request: ReadingBatchRequest):
+    """
+    Store a batch of minute readings from one or more meters.
+
+    - readings: List of {product_id, timestamp, watts}; timestamps are UTC
+
+    Readings, rollups, connection status and last-seen times are written together in
+    a few multi-path updates. Invalid readings are skipped and listed in errors.
+    """
+    return await IngestionService.ingest_readings(request.readings)
+
+
+@router.post("/admin/billing", response_model=BillingRunResponse, dependencies=[Depends(require_admin_token)])
+async def run_billing(year_month: Optional[str] = None):
+    """
+    Generate the bills of every user for a month in one batch.
+
+    - year_month: Optional month in YYYY-MM format that has ended (defaults to last month)
+
+    Stores a bill snapshot per user, so later /bill/{username} calls are a single read.
+    Users whose usage can't be read are listed as failed and get no snapshot.
+
+    Requires the X-Admin-Token header to match ADMIN_TOKEN; disabled while ADMIN_TOKEN is unset.
+    """
+    return await BillingService.run_billing(year_month)
 
 
 @router.post("/connection-status", response_model=ConnectionStatusResponse)
@@ -189,11 +343,12 @@ async def update_connection_status(request: ConnectionStatusRequest):
     - product_id: The product identifier
     - status: Boolean status value (true/false)
 
-    Returns the updated connection status.
+    Returns the connection status; unless CONNECTION_STATUS_FLUSH_SECONDS is 0 it is queued
+    and stored within that window.
 
     This endpoint is publicly accessible.
     """
-    return ElectricityUsageService.update_connection_status(
+    return await ElectricityUsageService.update_connection_status(
         request.product_id,
         request.status
     )
@@ -207,22 +362,52 @@ async def update_connection_status_get(product_id: str, status: bool):
     - product_id: The product identifier
     - status: Boolean status value (true/false)
 
-    Returns the updated connection status.
+    Returns the connection status; unless CONNECTION_STATUS_FLUSH_SECONDS is 0 it is queued
+    and stored within that window.
 
     This endpoint is publicly accessible.
     """
-    return ElectricityUsageService.update_connection_status(product_id, status)
+    return await ElectricityUsageService.update_connection_status(product_id, status)
+
+
+@router.post("/heartbeat/{product_id}", response_model=ConnectionStatusResponse)
+async def heartbeat(product_id: str):
+    """
+    Report that a device is alive.
+
+    - product_id: The product identifier
+
+    Marks the device connected and resets its expiry; a device that sends no heartbeat,
+    status update or readings for PRESENCE_TTL_SECONDS is shown as disconnected.
+    """
+    return await ElectricityUsageService.update_connection_status(product_id, True)
 
 
 @router.get("/connection-status", response_model=AllConnectionStatusResponse)
-async def get_all_connection_statuses():
+async def get_all_connection_statuses(status_filter: Optional[str] = Query(None, alias="status"),
+                                      last_active_before: Optional[datetime] = None,
+                                      sort: str = "username", order: str = "asc",
+                                      limit: Optional[int] = None, cursor: Optional[str] = None):
     """
     Get connection status for all users and their products.
 
-    Returns a list of all users with their product IDs and connection statuses.
+    - status: Only "online" or "offline" devices (optional)
+    - last_active_before: Only devices not active since this time, including devices never heard from (optional)
+    - sort: "username" (default), "product_id", "last_active" or "connection_status"
+    - order: "asc" (default) or "desc"
+    - limit: Most users per page (optional; without it every matching user is returned)
+    - cursor: The next_cursor of the previous page, to get the page after it
+
+    Returns the users with their product IDs and connection statuses, the number of
+    users matching the filters, and next_cursor while more pages follow.
     This is useful for displaying a table of all devices and their connection states.
+    Served from memory: a device is connected while it reported true and has been
+    heard from within PRESENCE_TTL_SECONDS.
 
     This endpoint is publicly accessible.
     """
-    return ElectricityUsageService.get_all_connection_statuses()
+    after = FleetStatusService.validate(status_filter, sort, order, limit, cursor)
+    return await ElectricityUsageService.get_all_connection_statuses(
+        status_filter, last_active_before, sort, order, limit, after
+    )
 
@@ -1,63 +1,76 @@
-from datetime import datetime, timedelta
-import calendar
+import asyncio
+from datetime import datetime
+from typing import List, Optional
 
+import numpy as np
 from fastapi.logger import logger
 
-from app.db.firebase import database
+from app.config import RESULT_CACHE_OPEN_PERIOD_TTL_SECONDS, BATCH_CHART_MAX_QUERIES, CONNECTION_STATUS_FLUSH_SECONDS
+from app.core.cache import result_cache
+from app.core.exceptions import BadRequestError
+from app.db.firebase import database, shared_reads
+from app.electricity.aggregation import decode_hour
+from app.electricity.fleet import FleetStatusService, Position
+from app.electricity.periods import is_period_settled, previous_month
+from app.electricity.rollups import RollupService, batched_rollup_writes
+from app.electricity.presence import presence_registry
+from app.electricity.status_buffer import connection_status_buffer
 
-from app.electricity.models import ChartDataPoint, ChartDataResponse, PaymentHistoryResponse, PaymentRecord, \
-    BillResponse, ConnectionStatusResponse, AllConnectionStatusResponse, UserProductStatus
+from app.electricity.models import ChartDataPoint, ChartDataResponse, ChartQuery, BatchChartResponse, \
+    PaymentHistoryResponse, PaymentRecord, \
+    BillResponse, ConnectionStatusResponse, AllConnectionStatusResponse
 
 
+# Batch chart queries, coarsest first (the order they are started in)
+GRANULARITY_ORDER = ("monthly", "daily", "hourly", "minutely")
+
 
 class ElectricityUsageService:
     @staticmethod
-    def get_minutely_usage(product_id: str, date_str: str, hour: str) -> ChartDataResponse:
+    def _cache_ttl(period: str):
+        """
+        Results for settled periods are cached indefinitely; periods in progress or still
+        within the grace window for late readings expire quickly.
+        """
+        return None if is_period_settled(period) else RESULT_CACHE_OPEN_PERIOD_TTL_SECONDS
+
+    @staticmethod
+    async def get_minutely_usage(product_id: str, date_str: str, hour: str) -> ChartDataResponse:
         """Get minutely average electricity usage for a specific hour in a day."""
+        cache_key = (product_id, "minutely", f"{date_str} {hour}")
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         try:
             # Access the Firebase path for the specific product, date, and hour
             ref_path = f"electricity_usage/{product_id}/{date_str}/{hour}"
-            minute_data = database.child(ref_path).get() or {}
+            minute_data = await database.child(ref_path).get() or {}
 
-            # Convert to chart data points sorted by minute
-            data_points = []
+            # Decode into a 60-slot array (object or array format) with NaN for missing minutes
+            minute_values = decode_hour(minute_data)
 
-            # Handle both object format and array format data
-            if isinstance(minute_data, dict):
-                # Process dictionary-style data (minute: value)
-                for minute, value in sorted(minute_data.items()):
-                    # Skip null values and ensure we have a valid float
-                    if value is not None:
-                        try:
-                            watt_value = float(value)
-                            data_points.append(ChartDataPoint(
-                                label=minute,
-                                value=round(watt_value, 2)
-                            ))
-                        except (ValueError, TypeError):
-                            # Skip invalid values
-                            logger.warning(f"Invalid value for minute {minute}: {value}")
-            elif isinstance(minute_data, list):
-                # Process array-style data where index is the minute
-                for index, value in enumerate(minute_data):
-                    # Skip null values
-                    if value is not None:
-                        try:
-                            watt_value = float(value)
-                            minute_str = f"{index:02d}"
-                            data_points.append(ChartDataPoint(
-                                label=minute_str,
-                                value=round(watt_value, 2)
-                            ))
-                        except (ValueError, TypeError):
-                            # Skip invalid values
-                            logger.warning(f"Invalid value for minute {index}: {value}")
+            # Convert to chart data points sorted by minute
+            data_points = [
+                ChartDataPoint(
+                    label=f"{minute:02d}",
+                    value=round(float(minute_values[minute]), 2)
+                )
+                for minute in np.flatnonzero(~np.isnan(minute_values))
+            ]
 
-            return ChartDataResponse(
+            result = ChartDataResponse(
                 data_points=data_points,
                 chart_title=f"Minute-by-Minute Usage on {date_str} at {hour}:00",
                 x_axis_label="Minute"
             )
+            try:
+                ttl = ElectricityUsageService._cache_ttl(f"{date_str} {hour}")
+            except ValueError:
+                # Not a period the cache can tell the age of
+                return result
+            result_cache.set(cache_key, result, ttl=ttl)
+            return result
         except Exception as e:
             logger.error(f"Error retrieving minutely data: {str(e)}")
             return ChartDataResponse(
@@ -67,55 +80,37 @@ class ElectricityUsageService:
             )
 
     @staticmethod
-    def get_hourly_usage(product_id: str, date_str: str) -> ChartDataResponse:
+    async def get_hourly_usage(product_id: str, date_str: str) -> ChartDataResponse:
         """Get hourly average electricity usage for a specific day."""
+        cache_key = (product_id, "hourly", date_str)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         try:
-            # Access the Firebase path for the specific product and date
-            ref_path = f"electricity_usage/{product_id}/{date_str}"
-            day_data = database.child(ref_path).get() or {}
+            # Hourly buckets come from the rollup store, or the raw day if they're missing
+            hour_buckets = await RollupService.get_hour_buckets(product_id, date_str)
 
             data_points = []
 
             # Process each hour in the day
-            for hour in sorted(day_data.keys()):
-                # Skip non-hour keys like "connection_status"
-                if not hour.isdigit():
-                    continue
-
-                hour_data = day_data.get(hour, {})
-                hour_values = []
-
-                # Handle both object format and array format data
-                if isinstance(hour_data, dict):
-                    # Dictionary format (minute: value)
-                    for minute, value in hour_data.items():
-                        if value is not None:
-                            try:
-                                hour_values.append(float(value))
-                            except (ValueError, TypeError):
-                                continue
-                elif isinstance(hour_data, list):
-                    # Array format where index is the minute
-                    for value in hour_data:
-                        if value is not None:
-                            try:
-                                hour_values.append(float(value))
-                            except (ValueError, TypeError):
-                                continue
-
-                # Calculate the hour's average if we have values
-                if hour_values:
-                    hour_avg = sum(hour_values) / len(hour_values)
+            for hour in sorted(hour_buckets.keys()):
+                bucket = hour_buckets[hour]
+
+                # Add the hour's average if we have values
+                if bucket.count:
                     data_points.append(ChartDataPoint(
                         label=f"{hour}:00",
-                        value=round(hour_avg, 2)
+                        value=round(bucket.mean, 2)
                     ))
 
-            return ChartDataResponse(
+            result = ChartDataResponse(
                 data_points=data_points,
                 chart_title=f"Hourly Usage on {date_str}",
                 x_axis_label="Hour"
             )
+            result_cache.set(cache_key, result, ttl=ElectricityUsageService._cache_ttl(date_str))
+            return result
         except Exception as e:
             logger.error(f"Error retrieving hourly data: {str(e)}")
             return ChartDataResponse(
@@ -125,73 +120,38 @@ class ElectricityUsageService:
             )
 
     @staticmethod
-    def get_daily_usage(product_id: str, year_month: str) -> ChartDataResponse:
+    async def get_daily_usage(product_id: str, year_month: str) -> ChartDataResponse:
         """Get daily average electricity usage for a specific month."""
+        cache_key = (product_id, "daily", year_month)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         try:
             # Extract year and month from input
             year, month = year_month.split('-')
 
-            # Calculate the number of days in the month
-            _, days_in_month = calendar.monthrange(int(year), int(month))
+            # Daily buckets come from the rollup store; missing days are rolled up from raw data
+            day_buckets, _ = await RollupService.get_month_buckets(product_id, year_month)
 
             data_points = []
 
-            # For each day in the month
-            for day in range(1, days_in_month + 1):
-                # Format the date string for Firebase
-                date_str = f"{year_month}-{day:02d}"
-
-                try:
-                    # Get data for the day
-                    day_ref_path = f"electricity_usage/{product_id}/{date_str}"
-                    day_data = database.child(day_ref_path).get()
-
-                    if not day_data:
-                        continue  # Skip if no data for this day
-
-                    # Calculate the daily average across all hours and minutes
-                    all_values = []
-
-                    for hour, hour_data in day_data.items():
-                        # Skip non-hour keys
-                        if not hour.isdigit():
-                            continue
-
-                        # Process each minute in the hour
-                        if isinstance(hour_data, dict):
-                            for minute, value in hour_data.items():
-                                if value is not None:
-                                    try:
-                                        all_values.append(float(value))
-                                    except (ValueError, TypeError):
-                                        continue
-                        elif isinstance(hour_data, list):
-                            for value in hour_data:
-                                if value is not None:
-                                    try:
-                                        all_values.append(float(value))
-                                    except (ValueError, TypeError):
-                                        continue
-
-                    # Add data point if we have values
-                    if all_values:
-                        daily_avg = sum(all_values) / len(all_values)
-                        data_points.append(ChartDataPoint(
-                            label=f"{day:02d}",
-                            value=round(daily_avg, 2)
-                        ))
-                except Exception as e:
-                    logger.warning(f"Error processing day {date_str}: {str(e)}")
-                    continue  # Skip this day if there's an error
+            for day in sorted(day_buckets.keys()):
+                data_points.append(ChartDataPoint(
+                    label=day,
+                    value=round(day_buckets[day].mean, 2)
+                ))
 
             # Get month name for the chart title
             month_name = datetime.strptime(month, "%m").strftime("%B")
 
-            return ChartDataResponse(
+            result = ChartDataResponse(
                 data_points=data_points,
                 chart_title=f"Daily Usage in {month_name} {year}",
                 x_axis_label="Day"
             )
+            result_cache.set(cache_key, result, ttl=ElectricityUsageService._cache_ttl(year_month))
+            return result
         except Exception as e:
             logger.error(f"Error retrieving daily data: {str(e)}")
             return ChartDataResponse(
@@ -201,74 +161,34 @@ class ElectricityUsageService:
             )
 
     @staticmethod
-    def get_monthly_usage(product_id: str, year: str) -> ChartDataResponse:
+    async def get_monthly_usage(product_id: str, year: str) -> ChartDataResponse:
         """Get monthly average electricity usage for a specific year."""
+        cache_key = (product_id, "monthly", year)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         try:
-            data_points = []
+            # Monthly buckets come from the rollup store; missing months are rolled up from daily buckets
+            month_buckets = await RollupService.get_year_buckets(product_id, year)
 
-            # For each month in the year
-            for month in range(1, 13):
-                month_str = f"{month:02d}"
+            data_points = []
 
-                try:
-                    # Get all data for the month
-                    month_ref_path = f"electricity_usage/{product_id}"
-                    year_month = f"{year}-{month_str}"
-
-                    # Get all days for this month
-                    all_month_values = []
-
-                    # For each day in the month
-                    _, days_in_month = calendar.monthrange(int(year), int(month))
-                    for day in range(1, days_in_month + 1):
-                        date_str = f"{year_month}-{day:02d}"
-                        day_ref_path = f"{month_ref_path}/{date_str}"
-                        day_data = database.child(day_ref_path).get()
-
-                        if not day_data:
-                            continue  # Skip if no data for this day
-
-                        # Process each hour in the day
-                        for hour, hour_data in day_data.items():
-                            # Skip non-hour keys
-                            if not hour.isdigit():
-                                continue
-
-                            # Process each minute in the hour
-                            if isinstance(hour_data, dict):
-                                for minute, value in hour_data.items():
-                                    if value is not None:
-                                        try:
-                                            all_month_values.append(float(value))
-                                        except (ValueError, TypeError):
-                                            continue
-                            elif isinstance(hour_data, list):
-                                for value in hour_data:
-                                    if value is not None:
-                                        try:
-                                            all_month_values.append(float(value))
-                                        except (ValueError, TypeError):
-                                            continue
-
-                    # Calculate monthly average if we have values
-                    if all_month_values:
-                        monthly_avg = sum(all_month_values) / len(all_month_values)
-
-                        # Get month name for the label
-                        month_name = datetime.strptime(month_str, "%m").strftime("%b")
-                        data_points.append(ChartDataPoint(
-                            label=month_name,
-                            value=round(monthly_avg, 2)
-                        ))
-                except Exception as e:
-                    logger.warning(f"Error processing month {year_month}: {str(e)}")
-                    continue  # Skip this month if there's an error
+            for month_str in sorted(month_buckets.keys()):
+                # Get month name for the label
+                month_name = datetime.strptime(month_str, "%m").strftime("%b")
+                data_points.append(ChartDataPoint(
+                    label=month_name,
+                    value=round(month_buckets[month_str].mean, 2)
+                ))
 
-            return ChartDataResponse(
+            result = ChartDataResponse(
                 data_points=data_points,
                 chart_title=f"Monthly Usage in {year}",
                 x_axis_label="Month"
             )
+            result_cache.set(cache_key, result, ttl=ElectricityUsageService._cache_ttl(year))
+            return result
         except Exception as e:
             logger.error(f"Error retrieving monthly data: {str(e)}")
             return ChartDataResponse(
@@ -278,19 +198,63 @@ class ElectricityUsageService:
             )
 
     @staticmethod
-    def get_payment_history(username: str) -> PaymentHistoryResponse:
+    async def _get_chart(query: ChartQuery) -> ChartDataResponse:
+        """Run one chart query of a batch."""
+        if query.granularity == "minutely":
+            date_str, _, hour = query.period.partition(" ")
+            if len(date_str) != 10 or len(hour) != 2:
+                return ChartDataResponse(
+                    data_points=[],
+                    chart_title=f"No data available for {query.period}",
+                    x_axis_label="Minute"
+                )
+            return await ElectricityUsageService.get_minutely_usage(query.product_id, date_str, hour)
+        if query.granularity == "hourly":
+            return await ElectricityUsageService.get_hourly_usage(query.product_id, query.period)
+        if query.granularity == "daily":
+            return await ElectricityUsageService.get_daily_usage(query.product_id, query.period)
+        return await ElectricityUsageService.get_monthly_usage(query.product_id, query.period)
+
+    @staticmethod
+    async def get_chart_batch(queries: List[ChartQuery]) -> BatchChartResponse:
+        """
+        Run several chart queries concurrently and return their charts in query order.
+
+        Repeated queries are computed once, and database reads made by different queries
+        are shared. Coarser queries start first, so the month ranges they read are already
+        in flight when finer queries ask for single days inside them. Rollups computed on
+        the way are stored together once every query is done.
+        """
+        if len(queries) > BATCH_CHART_MAX_QUERIES:
+            raise BadRequestError(f"A batch can hold at most {BATCH_CHART_MAX_QUERIES} queries")
+
+        unique_queries = {(query.product_id, query.granularity, query.period): query for query in queries}
+        ordered = sorted(unique_queries, key=lambda key: GRANULARITY_ORDER.index(key[1]))
+        with shared_reads():
+            async with batched_rollup_writes():
+                charts = await asyncio.gather(
+                    *(ElectricityUsageService._get_chart(unique_queries[key]) for key in ordered)
+                )
+
+        chart_by_query = dict(zip(ordered, charts))
+        return BatchChartResponse(
+            results=[chart_by_query[(query.product_id, query.granularity, query.period)] for query in queries]
+        )
+
+    @staticmethod
+    async def get_payment_history(username: str) -> PaymentHistoryResponse:
         """Get the payment history for a user."""
         try:
             # Get user data
             user_ref_path = f"user_details/{username}"
-            user_data = database.child(user_ref_path).get() or {}
+            user_data = await database.child(user_ref_path).get() or {}
 
             # Get user email
             email = user_data.get("email", "")
 
             # Get payments
             payments_ref_path = f"user_details/{username}/payments"
-            payments_data = database.child(payments_ref_path).get() or {}
+            payments_data = await database.child(payments_ref_path).get() or {}
 
             payment_records = []
             for month, amount in payments_data.items():
@@ -342,85 +306,66 @@ class ElectricityUsageService:
         return tiers[-1][1]
 
     @staticmethod
-    def calculate_total_kwh_for_month(product_id: str, year_month: str) -> float:
-        """Calculate the total kWh used in a month."""
+    async def compute_total_kwh_for_month(product_id: str, year_month: str) -> float:
+        """Calculate the total kWh used in a month, raising if the usage data can't be read."""
+        cache_key = (product_id, "total_kwh", year_month)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Hourly buckets for every day of the month, from the rollup store where available
+        _, hourly = await RollupService.get_month_buckets(product_id, year_month, with_hourly=True)
+
+        # Track the total watt-hours for the month
+        total_watt_hours = 0
+
+        for hour_buckets in hourly.values():
+            for bucket in hour_buckets.values():
+                # Add one hour's worth of energy at the hour's average power level
+                if bucket.count:
+                    total_watt_hours += bucket.mean
+
+        # Convert watt-hours to kilowatt-hours
+        total_kwh = round(total_watt_hours / 1000, 2)
+
+        result_cache.set(cache_key, total_kwh, ttl=ElectricityUsageService._cache_ttl(year_month))
+        return total_kwh
+
+    @staticmethod
+    async def calculate_total_kwh_for_month(product_id: str, year_month: str) -> float:
+        """Calculate the total kWh used in a month (0.0 if the usage data can't be read)."""
         try:
-            year, month = year_month.split('-')
-            _, days_in_month = calendar.monthrange(int(year), int(month))
-
-            # Track the total watt-hours for the month
-            total_watt_hours = 0
-
-            # Loop through all days in the month
-            for day in range(1, days_in_month + 1):
-                date_str = f"{year_month}-{day:02d}"
-
-                # Get data for this day
-                day_ref_path = f"electricity_usage/{product_id}/{date_str}"
-                day_data = database.child(day_ref_path).get() or {}
-
-                # Loop through all hours in the day
-                for hour, hour_data in day_data.items():
-                    if not hour.isdigit():
-                        continue  # Skip non-hour keys
-
-                    # Calculate the average watts for this hour
-                    hour_watt_values = []
-
-                    # Process minutes
-                    if isinstance(hour_data, dict):
-                        for minute, watt_value in hour_data.items():
-                            if watt_value is not None:
-                                try:
-                                    hour_watt_values.append(float(watt_value))
-                                except (ValueError, TypeError):
-                                    continue
-                    elif isinstance(hour_data, list):
-                        for minute_value in hour_data:
-                            if minute_value is not None:
-                                try:
-                                    hour_watt_values.append(float(minute_value))
-                                except (ValueError, TypeError):
-                                    continue
-
-                    # If we have values for this hour, calculate the average and add to total watt-hours
-                    if hour_watt_values:
-                        avg_watts_for_hour = sum(hour_watt_values) / len(hour_watt_values)
-                        # Add one hour's worth of energy at this power level
-                        total_watt_hours += avg_watts_for_hour
-
-            # Convert watt-hours to kilowatt-hours
-            total_kwh = total_watt_hours / 1000
-
-            return round(total_kwh, 2)
+            return await ElectricityUsageService.compute_total_kwh_for_month(product_id, year_month)
         except Exception as e:
             logger.error(f"Error calculating kWh for {year_month}: {str(e)}")
             return 0.0
 
     @staticmethod
-    def generate_bill(username: str) -> BillResponse:
+    async def generate_bill(username: str) -> BillResponse:
         """Generate a bill for the past month if it's not already paid."""
         try:
-            # Get current date and extract last month
-            current_date = datetime.utcnow()
-            first_day_of_current_month = current_date.replace(day=1)
-            last_day_of_last_month = first_day_of_current_month - timedelta(days=1)
-            last_month = last_day_of_last_month.strftime("%Y-%m")
+            # Get last month
+            last_month = previous_month()
 
-            # Get user's product ID (needed for both paid and unpaid cases)
+            # A single read of the user record covers the product ID, payments and any bill snapshot
             user_ref_path = f"user_details/{username}"
-            user_data = database.child(user_ref_path).get() or {}
+            user_data = await database.child(user_ref_path).get() or {}
 
             product_id = user_data.get("product_id", "")
             if not product_id:
                 raise ValueError(f"No product_id found for user {username}")
 
-            # Calculate total kWh for last month (needed for both paid and unpaid cases)
-            total_kwh = ElectricityUsageService.calculate_total_kwh_for_month(product_id, last_month)
+            # Use the snapshot written by the billing run if there is one
+            bill_snapshot = (user_data.get("bills") or {}).get(last_month)
+            if isinstance(bill_snapshot, dict) and "total_kwh" in bill_snapshot:
+                total_kwh = float(bill_snapshot["total_kwh"])
+            else:
+                # Calculate total kWh for last month (needed for both paid and unpaid cases); a failed
+                # read must produce an error, not a bill for zero usage
+                total_kwh = await ElectricityUsageService.compute_total_kwh_for_month(product_id, last_month)
 
             # Check if bill is already paid
-            payments_ref_path = f"user_details/{username}/payments"
-            payments_data = database.child(payments_ref_path).get() or {}
+            payments_data = user_data.get("payments") or {}
 
             is_paid = last_month in payments_data
 
@@ -465,32 +410,27 @@ class ElectricityUsageService:
             )
 
     @staticmethod
-    def update_connection_status(product_id: str, status: bool) -> ConnectionStatusResponse:
+    async def update_connection_status(product_id: str, status: bool) -> ConnectionStatusResponse:
         """Update the connection status for a product."""
         try:
-            # Path to the connection_status node
-            status_ref_path = f"electricity_usage/{product_id}/connection_status"
+            now = datetime.utcnow()
 
-            # Update the status
-            result = database.child(status_ref_path).set(status)
+            # Presence is tracked in memory; the status and last-seen index are written behind,
+            # coalesced with other updates
+            presence_registry.report(product_id, status, now)
+            written = await connection_status_buffer.record(product_id, status, now)
 
-            if result:
-                # Format current time for the response
-                current_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-
-                return ConnectionStatusResponse(
-                    product_id=product_id,
-                    status=status,
-                    updated_at=current_time,
-                    message=f"Connection status for product {product_id} successfully updated to {status}"
-                )
+            if written:
+                message = f"Connection status for product {product_id} successfully updated to {status}"
             else:
-                return ConnectionStatusResponse(
-                    product_id=product_id,
-                    status=status,
-                    updated_at=datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
-                    message=f"Failed to update connection status for product {product_id}"
-                )
+                message = f"Connection status update for product {product_id} to {status} accepted; " \
+                          f"it is stored within {CONNECTION_STATUS_FLUSH_SECONDS:g} seconds"
+            return ConnectionStatusResponse(
+                product_id=product_id,
+                status=status,
+                updated_at=now.strftime("%Y-%m-%d %H:%M:%S"),
+                message=message
+            )
         except Exception as e:
             logger.error(f"Error updating connection status for {product_id}: {str(e)}")
             return ConnectionStatusResponse(
@@ -501,96 +441,31 @@ class ElectricityUsageService:
             )
 
     @staticmethod
-    def get_all_connection_statuses() -> AllConnectionStatusResponse:
-        """Get connection status for all users and their products."""
+    async def get_all_connection_statuses(status: Optional[str] = None,
+                                          last_active_before: Optional[datetime] = None,
+                                          sort: str = "username", order: str = "asc",
+                                          limit: Optional[int] = None,
+                                          after: Optional[Position] = None) -> AllConnectionStatusResponse:
+        """
+        Get connection status for users and their products, from the in-memory presence registry.
+
+        Users are filtered by status and last_active_before, sorted, and returned a page of
+        limit users at a time starting after the position of a cursor (all of them if limit is None).
+        """
         try:
-            # Get current timestamp
-            current_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-
-            # Get all users
-            users_ref_path = "user_details"
-            users_data = database.child(users_ref_path).get() or {}
-
-            user_statuses = []
-
-            # Process each user
-            for username, user_data in users_data.items():
-                if not isinstance(user_data, dict):
-                    continue
-
-                # Get user's product_id
-                product_id = user_data.get("product_id")
-                if not product_id:
-                    continue
-
-                # Get user's email
-                email = user_data.get("email", "")
+            await presence_registry.ensure_loaded()
 
-                # Get connection status for the product
-                status_ref_path = f"electricity_usage/{product_id}/connection_status"
-                connection_status = database.child(status_ref_path).get()
-
-                # Default to False if no status is found
-                if connection_status is None:
-                    connection_status = False
-
-                # Try to determine the last active time by finding the most recent data entry
-                last_active = None
-                try:
-                    # Get the electricity usage data for the product
-                    usage_ref_path = f"electricity_usage/{product_id}"
-                    usage_data = database.child(usage_ref_path).get() or {}
-
-                    # Find the most recent date that has data
-                    # Skip non-date keys like "connection_status"
-                    dates = [d for d in usage_data.keys() if d != "connection_status" and "-" in d]
-                    if dates:
-                        # Sort dates in descending order
-                        dates.sort(reverse=True)
-                        latest_date = dates[0]
-
-                        # Find the latest hour in the latest date
-                        latest_date_data = usage_data.get(latest_date, {})
-                        hours = [h for h in latest_date_data.keys() if h.isdigit()]
-                        if hours:
-                            # Sort hours in descending order
-                            hours.sort(key=int, reverse=True)
-                            latest_hour = hours[0]
-
-                            # Find the latest minute in the latest hour
-                            latest_hour_data = latest_date_data.get(latest_hour, {})
-
-                            if isinstance(latest_hour_data, dict):
-                                minutes = [m for m in latest_hour_data.keys() if m.isdigit()]
-                                if minutes:
-                                    # Sort minutes in descending order
-                                    minutes.sort(key=int, reverse=True)
-                                    latest_minute = minutes[0]
-
-                                    # Format the last active time
-                                    last_active = f"{latest_date} {latest_hour}:{latest_minute}"
-                            elif isinstance(latest_hour_data, list):
-                                # Find the last non-null value in the array
-                                for i in range(len(latest_hour_data) - 1, -1, -1):
-                                    if latest_hour_data[i] is not None:
-                                        last_active = f"{latest_date} {latest_hour}:{i:02d}"
-                                        break
-                except Exception as e:
-                    logger.warning(f"Error determining last active time for {product_id}: {str(e)}")
-
-                # Add user status to the list
-                user_statuses.append(UserProductStatus(
-                    username=username,
-                    product_id=product_id,
-                    email=email,
-                    connection_status=connection_status,
-                    last_active=last_active
-                ))
+            now = datetime.utcnow()
+            user_statuses = FleetStatusService.filter_users(
+                presence_registry.user_statuses(now), status, last_active_before
+            )
+            page, next_cursor = FleetStatusService.page(user_statuses, sort, order, limit, after)
 
             return AllConnectionStatusResponse(
-                timestamp=current_time,
-                users=user_statuses,
-                total_count=len(user_statuses)
+                timestamp=now.strftime("%Y-%m-%d %H:%M:%S"),
+                users=page,
+                total_count=len(user_statuses),
+                next_cursor=next_cursor
             )
         except Exception as e:
             logger.error(f"Error retrieving connection statuses: {str(e)}")
@@ -598,4 +473,4 @@ class ElectricityUsageService:
                 timestamp=datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
                 users=[],
                 total_count=0
-            )
\ No newline at end of file
+            )
@@ -0,0 +1,117 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi.logger import logger
+
+from app.config import CONNECTION_STATUS_FLUSH_SECONDS, CONNECTION_STATUS_MAX_PENDING
+from app.core.metrics import connection_status_updates, connection_status_flushes, connection_status_writes_saved, \
+    connection_status_dropped
+from app.db.firebase import database
+from app.electricity.last_seen import last_seen_path, format_last_seen
+
+
+class ConnectionStatusBuffer:
+    """
+    Write-behind buffer for connection status updates.
+
+    Updates are kept per product, so a device reporting several times within the window
+    costs one write, and every product's latest status and last-seen time is written
+    together in one multi-path update. An update is written at most
+    CONNECTION_STATUS_FLUSH_SECONDS after it arrives (sooner once
+    CONNECTION_STATUS_MAX_PENDING products are waiting), and the buffer is flushed at
+    shutdown. A failed write is retried at the next flush; updates still unwritten at
+    shutdown are logged and counted as dropped. With a window of 0 every update is
+    written immediately.
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, Tuple[bool, Optional[datetime]]] = {}  # product_id -> (status, time of the update)
+        self._received = 0  # Updates since the last flush; all but one of them are writes saved
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def record(self, product_id: str, status: bool, now: Optional[datetime]) -> bool:
+        """
+        Queue a status update; now is the device's last-seen time, or None to leave that as it is.
+        Returns whether the update was written already, rather than queued.
+        """
+        connection_status_updates.inc()
+        if CONNECTION_STATUS_FLUSH_SECONDS <= 0:
+            await database.update(self._updates({product_id: (status, now)}))
+            connection_status_flushes.inc()
+            return True
+
+        if now is None and product_id in self._pending:
+            # Keep the last-seen time of the update this one replaces
+            now = self._pending[product_id][1]
+        self._pending[product_id] = (status, now)
+        self._received += 1
+
+        if len(self._pending) >= CONNECTION_STATUS_MAX_PENDING:
+            self._schedule(0)
+        elif self._timer is None:
+            # The window starts with the oldest pending update, which bounds how stale any write gets
+            self._schedule(CONNECTION_STATUS_FLUSH_SECONDS)
+        return False
+
+    def discard(self, product_ids: Iterable[str]):
+        """Drop pending updates superseded by a direct write of the same products."""
+        for product_id in product_ids:
+            self._pending.pop(product_id, None)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, lambda: asyncio.ensure_future(self.flush()))
+
+    @staticmethod
+    def _updates(pending: Dict[str, Tuple[bool, Optional[datetime]]]) -> dict:
+        updates = {}
+        for product_id, (status, updated_at) in pending.items():
+            updates[f"electricity_usage/{product_id}/connection_status"] = status
+            if updated_at is not None:
+                updates[last_seen_path(product_id)] = format_last_seen(updated_at)
+        return updates
+
+    async def flush(self):
+        """Write every pending update now, in one multi-path update."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        pending, self._pending = self._pending, {}
+        received, self._received = self._received, 0
+        if not pending:
+            connection_status_writes_saved.inc(received)
+            return
+
+        try:
+            await database.update(self._updates(pending))
+            connection_status_flushes.inc()
+            connection_status_writes_saved.inc(received - 1)
+        except Exception as e:
+            logger.error(f"Error writing {len(pending)} buffered connection statuses: {str(e)}")
+            # Keep them for the next attempt, unless newer updates arrived meanwhile
+            for product_id, update in pending.items():
+                self._pending.setdefault(product_id, update)
+            self._received += received
+            if self._timer is None:
+                self._schedule(CONNECTION_STATUS_FLUSH_SECONDS)
+
+    async def close(self):
+        """Flush at shutdown; updates that still can't be written are dropped, and reported."""
+        await self.flush()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending:
+            logger.error(
+                f"Dropping {len(self._pending)} connection status updates that couldn't be written at shutdown: "
+                f"{', '.join(sorted(self._pending))}"
+            )
+            connection_status_dropped.inc(len(self._pending))
+            self._pending = {}
+            self._received = 0
+
+
+connection_status_buffer = ConnectionStatusBuffer()
@@ -0,0 +1,110 @@
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.electricity.aggregation import (
+    BucketStats, HOURS_PER_DAY, MINUTES_PER_HOUR, bucket_stats, decode_days, merge_stats
+)
+
+
+MINUTES_PER_DAY = HOURS_PER_DAY * MINUTES_PER_HOUR
+
+
+class DaySeries:
+    """
+    One day of minute readings: a 1440-slot float32 array indexed by minute of the day
+    plus a validity mask. Invalid slots hold NaN. Readings stored without a minute of
+    their own are kept as per-hour stats in extra, and only count towards hourly_stats.
+    """
+
+    __slots__ = ("date", "values", "valid", "extra")
+
+    def __init__(self, date: str, values: np.ndarray, valid: np.ndarray, extra: Optional[BucketStats] = None):
+        self.date = date
+        self.values = values
+        self.valid = valid
+        self.extra = extra
+
+    @classmethod
+    def from_payload(cls, date: str, day_data, dtype=np.float32) -> "DaySeries":
+        """
+        Decode a day's raw Firebase payload. Pass dtype=np.float64 where the readings
+        themselves are sent on, as float32 changes values like 0.1 to 0.10000000149011612.
+        """
+        values = np.full((1, HOURS_PER_DAY, MINUTES_PER_HOUR), np.nan, dtype=dtype)
+        _, extra = decode_days([day_data], out=values)
+        values = values.reshape(MINUTES_PER_DAY)
+        return cls(date, values, ~np.isnan(values), BucketStats(*(stat[0] for stat in extra)) if extra is not None else None)
+
+    @property
+    def count(self) -> int:
+        return int(self.valid.sum())
+
+    def hourly_stats(self) -> BucketStats:
+        """Per-hour sum/count/min/max, each of shape (24,)."""
+        return merge_stats(bucket_stats(
+            self.values.reshape(HOURS_PER_DAY, MINUTES_PER_HOUR),
+            valid=self.valid.reshape(HOURS_PER_DAY, MINUTES_PER_HOUR)
+        ), self.extra)
+
+    def readings(self) -> Iterator[Tuple[str, float]]:
+        """Yield ("HH:MM", watts) for every valid minute, in order."""
+        for minute in np.flatnonzero(self.valid):
+            hour, minute_of_hour = divmod(int(minute), MINUTES_PER_HOUR)
+            yield f"{hour:02d}:{minute_of_hour:02d}", float(self.values[minute])
+
+    def latest_minute(self) -> Optional[str]:
+        """The "HH:MM" of the last valid minute, if any."""
+        minutes = np.flatnonzero(self.valid)
+        if not len(minutes):
+            return None
+        hour, minute_of_hour = divmod(int(minutes[-1]), MINUTES_PER_HOUR)
+        return f"{hour:02d}:{minute_of_hour:02d}"
+
+
+class MonthSeries:
+    """
+    Several days of minute readings stored as one (days, 1440) float32 matrix plus a
+    validity mask, with one row per date, and per-day, per-hour stats of readings
+    without a minute of their own in extra (see DaySeries).
+    """
+
+    __slots__ = ("dates", "values", "valid", "extra")
+
+    def __init__(self, dates: List[str], values: np.ndarray, valid: np.ndarray,
+                 extra: Optional[BucketStats] = None):
+        self.dates = dates
+        self.values = values
+        self.valid = valid
+        self.extra = extra
+
+    @classmethod
+    def from_payload(cls, dates: List[str], payload: dict) -> "MonthSeries":
+        """
+        Decode the given dates out of a range-query payload keyed by date.
+
+        Each day's raw data is removed from the payload as soon as it has been decoded,
+        so the nested dicts can be freed while the rest of the month is converted.
+        """
+        values = np.full((len(dates), HOURS_PER_DAY, MINUTES_PER_HOUR), np.nan, dtype=np.float32)
+        extra = None
+        for index, date in enumerate(dates):
+            _, day_extra = decode_days([payload.pop(date, None)], out=values[index:index + 1])
+            if day_extra is not None:
+                if extra is None:
+                    extra = bucket_stats(np.full((len(dates), HOURS_PER_DAY, 1), np.nan))
+                for stat, day_stat in zip(extra, day_extra):
+                    stat[index] = day_stat[0]
+
+        values = values.reshape(len(dates), MINUTES_PER_DAY)
+        return cls(list(dates), values, ~np.isnan(values), extra)
+
+    def day(self, index: int) -> DaySeries:
+        """A view of one day of the month (no copy)."""
+        extra = BucketStats(*(stat[index] for stat in self.extra)) if self.extra is not None else None
+        return DaySeries(self.dates[index], self.values[index], self.valid[index], extra)
+
+    def hourly_stats(self) -> BucketStats:
+        """Per-day, per-hour sum/count/min/max, each of shape (days, 24)."""
+        shape = (len(self.dates), HOURS_PER_DAY, MINUTES_PER_HOUR)
+        return merge_stats(bucket_stats(self.values.reshape(shape), valid=self.valid.reshape(shape)), self.extra)
@@ -1,10 +1,71 @@
+import asyncio
+import logging
+import time
+
+# Measured from the start of the app's imports, so the startup log covers them
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.logger import logger
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.auth.routes import router as auth_router
 from app.electricity.routes import router as electricity_router
+from app.core.metrics import MetricsMiddleware, render_metrics
+from app.core.profiling import ProfilingMiddleware
+from app.config import PROFILING_ENABLED, STARTUP_WARMUP, validate_config
+from app.core.security import warm_up_password_pool
+from app.db import firebase
+from app.electricity.live import live_hub
+from app.electricity.presence import presence_registry
+from app.electricity.status_buffer import connection_status_buffer
+
+async def _load_presence():
+    try:
+        await presence_registry.ensure_loaded()
+    except Exception as e:
+        # The first fleet status request tries again
+        logger.error(f"Loading device presence failed: {str(e)}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Check the configuration, warm up connections and worker pools, start loading device presence
+    in the background, and log how long startup took. At shutdown, write pending presence and
+    status changes.
+    """
+    imported = time.perf_counter()
+    validate_config()
+
+    if STARTUP_WARMUP:
+        try:
+            await firebase.warm_up()
+            await warm_up_password_pool()
+        except Exception as e:
+            # The app still works, the first requests just pay for the set-up
+            logger.error(f"Startup warm-up failed: {str(e)}")
+        # Reads every user and device, so it doesn't hold up serving requests
+        asyncio.ensure_future(_load_presence())
+
+    ready = time.perf_counter()
+    # Logged through uvicorn's logger so it shows next to "Application startup complete"
+    logging.getLogger("uvicorn.error").info(
+        f"Startup completed in {(ready - _import_started) * 1000:.0f} ms "
+        f"(imports {(imported - _import_started) * 1000:.0f} ms, "
+        f"warm-up {(ready - imported) * 1000:.0f} ms)"
+    )
+    yield
+    await presence_registry.close()
+    await connection_status_buffer.close()
+    await live_hub.close()
+    firebase.shutdown()
 
 # Create FastAPI app
 app = FastAPI(
+    lifespan=lifespan,
     title="IoT One Meter API",
     description="API for authenticating users and retrieving electricity usage data from Firebase Realtime Database",
     version="1.0.0"
@@ -19,6 +80,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency, status and database usage per route, served at /metrics
+app.add_middleware(MetricsMiddleware)
+
+# On-demand profiling of requests sent with an X-Profile header (off unless PROFILING_ENABLED)
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
 # Include routers
 app.include_router(auth_router, prefix="/auth", tags=["authentication"])
 app.include_router(electricity_router, prefix="/electricity", tags=["electricity usage"])
@@ -32,6 +100,11 @@ async def root():
         "redoc_url": "/redoc"
     }
 
+# Prometheus metrics
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
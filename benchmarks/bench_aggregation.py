@@ -0,0 +1,134 @@
+"""
+Benchmark the vectorized aggregation kernel against the per-value Python loop
+it replaced, on one month of synthetic minute data, and compare the memory held
+by a raw month payload with its compact MonthSeries form.
+
+Usage: python -m benchmarks.bench_aggregation [--days 31] [--repeat 5]
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from app.electricity.aggregation import bucket_stats, decode_days, merge_stats
+from app.electricity.timeseries import MonthSeries
+
+
+def make_month(days: int, garbage_rate: float = 0.0, missing: int = 0, seed: int = 42) -> list:
+    """
+    One month of raw day payloads mixing dict and list hour encodings, decoded from JSON
+    as the database client returns them. garbage_rate is the fraction of hours holding a
+    non-numeric value; missing is the number of minutes left empty in each hour.
+    """
+    rng = random.Random(seed)
+    month = []
+    for _ in range(days):
+        day = {}
+        for hour in range(24):
+            values = [round(rng.uniform(50, 3000), 2) for _ in range(60)]
+            for _ in range(missing):
+                values[rng.randrange(60)] = None
+            if rng.random() < garbage_rate:
+                values[rng.randrange(60)] = "err"
+            if hour % 2:
+                day[f"{hour:02d}"] = values
+            else:
+                # Firebase leaves null minutes out of objects
+                day[f"{hour:02d}"] = {
+                    f"{minute:02d}": value for minute, value in enumerate(values) if value is not None
+                }
+        day["connection_status"] = True
+        month.append(day)
+    return json.loads(json.dumps(month))
+
+
+def legacy_hourly_buckets(month: list) -> list:
+    """The nested dict-or-list, skip None, try float() loop the service used to run, producing rollup buckets."""
+    result = []
+    for day_data in month:
+        hours = {}
+        for hour, hour_data in day_data.items():
+            if not hour.isdigit():
+                continue
+            hour_values = []
+            if isinstance(hour_data, dict):
+                for minute, value in hour_data.items():
+                    if value is not None:
+                        try:
+                            hour_values.append(float(value))
+                        except (ValueError, TypeError):
+                            continue
+            elif isinstance(hour_data, list):
+                for value in hour_data:
+                    if value is not None:
+                        try:
+                            hour_values.append(float(value))
+                        except (ValueError, TypeError):
+                            continue
+            if hour_values:
+                hours[hour] = (sum(hour_values), len(hour_values), min(hour_values), max(hour_values))
+        result.append(hours)
+    return result
+
+
+def kernel_hourly_buckets(month: list):
+    values, extra = decode_days(month)
+    return merge_stats(bucket_stats(values), extra)
+
+
+def best_of(func, month, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(month)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def payload_vs_series_bytes(month: list) -> tuple:
+    """Memory retained by a month payload as Firebase returns it, and by the same data as a MonthSeries."""
+    text = json.dumps({f"2025-01-{day + 1:02d}": day_data for day, day_data in enumerate(month)})
+
+    tracemalloc.start()
+    payload = json.loads(text)
+    payload_bytes = tracemalloc.get_traced_memory()[0]
+
+    series = MonthSeries.from_payload(sorted(payload), payload)
+    del payload
+    series_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return payload_bytes, series_bytes, series
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=int, default=31)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{args.days} days x 1440 minutes -> hourly (sum, count, min, max) buckets")
+    cases = (
+        ("complete hours", {}),
+        ("garbage in 1% of hours", {"garbage_rate": 0.01}),
+        ("3 minutes missing per hour", {"missing": 3}),
+    )
+    for label, options in cases:
+        month = make_month(args.days, **options)
+        legacy = best_of(legacy_hourly_buckets, month, args.repeat)
+        kernel = best_of(kernel_hourly_buckets, month, args.repeat)
+        print(
+            f"{label:27}: legacy loop {legacy * 1000:7.2f} ms, kernel {kernel * 1000:7.2f} ms, "
+            f"speedup {legacy / kernel:5.2f}x"
+        )
+
+    payload_bytes, series_bytes, _ = payload_vs_series_bytes(make_month(args.days, missing=3))
+    print(
+        f"memory: raw payload {payload_bytes / 1024:8.1f} KiB, "
+        f"MonthSeries {series_bytes / 1024:8.1f} KiB ({payload_bytes / series_bytes:4.1f}x smaller)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Benchmark the electricity endpoints' service calls on a synthetic fleet loaded into
+an offline storage backend, measuring latency, database calls and peak memory, and
+write a JSON report that can be compared with a previous run.
+
+Usage: python -m benchmarks.bench_service [--products 20] [--months 2] [--encoding mixed]
+                                          [--output report.json] [--compare previous.json]
+
+The backend comes from DATABASE_BACKEND ("memory" unless set; "sqlite" also works).
+"""
+import os
+
+os.environ.setdefault("DATABASE_BACKEND", "memory")
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark")
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+
+import app.db.firebase as firebase_db
+from app.config import DATABASE_BACKEND
+from app.core.cache import result_cache
+from app.db.backends import StorageBackend
+from app.electricity.periods import previous_month
+from app.electricity.service import ElectricityUsageService
+from benchmarks.synthetic import ENCODINGS, fleet_users, generate_fleet, month_range
+
+
+class CountingBackend(StorageBackend):
+    """Wraps a backend and counts the calls made through it, by operation."""
+
+    def __init__(self, backend: StorageBackend):
+        self.backend = backend
+        self.calls = Counter()
+
+    def get(self, path):
+        self.calls["get"] += 1
+        return self.backend.get(path)
+
+    def get_range(self, path, start=None, end=None, limit_to_first=None, limit_to_last=None):
+        self.calls["get_range"] += 1
+        return self.backend.get_range(path, start, end, limit_to_first, limit_to_last)
+
+    def set(self, path, value):
+        self.calls["set"] += 1
+        self.backend.set(path, value)
+
+    def update(self, path, values):
+        self.calls["update"] += 1
+        self.backend.update(path, values)
+
+
+def reset_derived_data(backend: StorageBackend, usernames):
+    """Drop everything the service derives from raw readings, so the next call starts cold."""
+    updates = {"electricity_rollups": None, "last_seen": None}
+    updates.update({f"user_details/{username}/bills": None for username in usernames})
+    backend.update("", updates)
+    result_cache.clear()
+
+
+def scenarios(username: str, product_id: str, year_month: str) -> dict:
+    """Service calls behind each benchmarked endpoint."""
+    date_str = f"{year_month}-01"
+    return {
+        "minutely": lambda: ElectricityUsageService.get_minutely_usage(product_id, date_str, "18"),
+        "hourly": lambda: ElectricityUsageService.get_hourly_usage(product_id, date_str),
+        "daily": lambda: ElectricityUsageService.get_daily_usage(product_id, year_month),
+        "monthly": lambda: ElectricityUsageService.get_monthly_usage(product_id, year_month[:4]),
+        "bill": lambda: ElectricityUsageService.generate_bill(username),
+        "connection_status": lambda: ElectricityUsageService.get_all_connection_statuses(),
+    }
+
+
+async def measure(call, counter: CountingBackend, repeat: int, before=None) -> dict:
+    """
+    Latency percentiles and database calls per call over `repeat` runs, then peak memory
+    of one more. before() runs ahead of every call to put the service in the state measured.
+    """
+    timings = []
+    counter.calls.clear()
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        await call()
+        timings.append(time.perf_counter() - start)
+    calls = {operation: count / repeat for operation, count in sorted(counter.calls.items())}
+
+    if before:
+        before()
+    tracemalloc.start()
+    await call()
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings) * 1000, 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 3),
+        "db_calls": calls,
+        "db_calls_total": sum(calls.values()),
+        "peak_kib": round(peak_bytes / 1024, 1),
+    }
+
+
+async def run_suite(args) -> dict:
+    months = month_range(args.end_month, args.months)
+    users = fleet_users(args.products)
+    usernames = [username for username, _ in users]
+
+    counter = CountingBackend(firebase_db.get_backend())
+    firebase_db.set_backend(counter)
+
+    start = time.perf_counter()
+    for updates in generate_fleet(args.products, months, args.encoding, args.null_rate, args.garbage_rate, args.seed):
+        counter.backend.update("", updates)
+    load_seconds = time.perf_counter() - start
+
+    def reset():
+        reset_derived_data(counter.backend, usernames)
+
+    username, product_id = users[0]
+    results = {}
+    for name, call in scenarios(username, product_id, args.end_month).items():
+        results[name] = {
+            # Nothing derived yet: no rollups, last-seen index, bill snapshots or cached results
+            "cold": await measure(call, counter, repeat=1, before=reset),
+            # Derived data in place, result cache empty
+            "steady": await measure(call, counter, args.repeat, before=result_cache.clear),
+            # Repeated calls served from the result cache where possible
+            "cached": await measure(call, counter, args.repeat),
+        }
+        cold = results[name]["cold"]
+        print(
+            f"{name:18s} cold {cold['p50_ms']:9.2f} ms {cold['db_calls_total']:6.0f} calls | "
+            f"steady {results[name]['steady']['p50_ms']:9.2f} ms {results[name]['steady']['db_calls_total']:6.1f} calls | "
+            f"cached {results[name]['cached']['p50_ms']:9.2f} ms | "
+            f"peak cold {cold['peak_kib']:8.1f} KiB, steady {results[name]['steady']['peak_kib']:8.1f} KiB"
+        )
+
+    return {
+        "meta": {
+            "created": datetime.utcnow().isoformat(timespec="seconds"),
+            "backend": DATABASE_BACKEND,
+            "products": args.products,
+            "months": months,
+            "encoding": args.encoding,
+            "null_rate": args.null_rate,
+            "garbage_rate": args.garbage_rate,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "load_seconds": round(load_seconds, 2),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+        },
+        "scenarios": results,
+    }
+
+
+def compare(report: dict, previous: dict):
+    """Print the change in median latency and database calls of every phase against a previous report."""
+    print(f"\ncompared with run from {previous['meta']['created']}:")
+    for name, result in report["scenarios"].items():
+        before = previous["scenarios"].get(name)
+        if before is None:
+            continue
+        for phase in ("cold", "steady", "cached"):
+            now_ms, then_ms = result[phase]["p50_ms"], before[phase]["p50_ms"]
+            change = (now_ms - then_ms) / then_ms * 100 if then_ms else 0.0
+            print(
+                f"{name:18s} {phase:6s} {then_ms:9.2f} -> {now_ms:9.2f} ms ({change:+6.1f}%), "
+                f"calls {before[phase]['db_calls_total']:6.1f} -> {result[phase]['db_calls_total']:6.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--months", type=int, default=2, help="months of minute data per product")
+    parser.add_argument("--end-month", default=previous_month(), help="last month of data, YYYY-MM")
+    parser.add_argument("--encoding", choices=ENCODINGS, default="mixed", help="how hours of minute data are stored")
+    parser.add_argument("--null-rate", type=float, default=0.02)
+    parser.add_argument("--garbage-rate", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="previous JSON report to compare with")
+    args = parser.parse_args()
+
+    if DATABASE_BACKEND == "firebase":
+        sys.exit("Refusing to benchmark against Firebase; set DATABASE_BACKEND=memory or sqlite")
+
+    report = asyncio.run(run_suite(args))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nreport written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(report, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Synthetic fleet generator: users, products and months of minute readings laid out
+like the production Realtime Database, with a configurable hour encoding and the
+nulls and garbage values real devices produce.
+"""
+import calendar
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+
+ENCODINGS = ("dict", "list", "mixed")
+
+# Non-numeric values seen in real uploads
+GARBAGE_VALUES = ("err", "", "n/a", "NaN")
+
+
+def month_range(end_month: str, months: int) -> List[str]:
+    """The `months` months up to and including end_month, oldest first, as "YYYY-MM"."""
+    year, month = map(int, end_month.split("-"))
+    result = []
+    for _ in range(months):
+        result.append(f"{year:04d}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return result[::-1]
+
+
+def make_day(rng: np.random.Generator, encoding: str = "mixed", null_rate: float = 0.02,
+             garbage_rate: float = 0.001) -> dict:
+    """
+    One day of raw minute readings keyed by "HH".
+
+    Hours are stored as {"MM": watts} dicts, 60-slot lists with None holes, or a random
+    mix of both. null_rate and garbage_rate are the fractions of minutes left empty or
+    holding a non-numeric value.
+    """
+    # A daily load curve peaking in the evening, plus noise
+    minutes = np.arange(24 * 60)
+    curve = 600 + 400 * np.sin((minutes / (24 * 60) - 0.45) * 2 * np.pi)
+    watts = np.round(np.clip(curve + rng.normal(0, 120, minutes.size), 0, None), 2).reshape(24, 60)
+
+    missing = rng.random((24, 60)) < null_rate
+    garbage = rng.random((24, 60)) < garbage_rate
+
+    day = {}
+    for hour in range(24):
+        values = watts[hour].tolist()
+        for minute in np.flatnonzero(missing[hour]):
+            values[minute] = None
+        for minute in np.flatnonzero(garbage[hour]):
+            values[minute] = GARBAGE_VALUES[int(rng.integers(len(GARBAGE_VALUES)))]
+
+        as_list = encoding == "list" or (encoding == "mixed" and rng.random() < 0.5)
+        if as_list:
+            day[f"{hour:02d}"] = values
+        else:
+            day[f"{hour:02d}"] = {f"{minute:02d}": value for minute, value in enumerate(values) if value is not None}
+    return day
+
+
+def fleet_users(products: int) -> List[Tuple[str, str]]:
+    """(username, product_id) of every user in a synthetic fleet."""
+    return [(f"user{index:04d}", f"meter{index:04d}") for index in range(products)]
+
+
+def generate_fleet(products: int, months: List[str], encoding: str = "mixed", null_rate: float = 0.02,
+                   garbage_rate: float = 0.001, seed: int = 42) -> Iterator[Dict[str, object]]:
+    """
+    Yield a synthetic fleet as multi-path updates, one per product, so large fleets can
+    be loaded into a backend without building the whole tree in memory.
+
+    Every product gets minute data for each day of the given months, a connection status
+    and a user record with payments for all but the last month.
+    """
+    rng = np.random.default_rng(seed)
+    for index, (username, product_id) in enumerate(fleet_users(products)):
+        updates = {
+            f"user_details/{username}": {
+                "email": f"{username}@example.com",
+                "product_id": product_id,
+                "password": "synthetic",
+                "payments": {month: round(float(rng.uniform(500, 5000)), 2) for month in months[:-1]},
+            },
+            f"electricity_usage/{product_id}/connection_status": bool(index % 5),
+        }
+
+        for year_month in months:
+            year, month = map(int, year_month.split("-"))
+            for day in range(1, calendar.monthrange(year, month)[1] + 1):
+                date_str = datetime(year, month, day).strftime("%Y-%m-%d")
+                updates[f"electricity_usage/{product_id}/{date_str}"] = make_day(
+                    rng, encoding, null_rate, garbage_rate
+                )
+
+        yield updates